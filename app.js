@@ -8,6 +8,8 @@ let currentLanguage = 'en';
 let currentCourseId = null;
 let currentLessonId = null;
 let testAnswers = {};
+let testToken = null;
+let currentBundle = null;  // course, lessons and words from /courses/<id>/bundle
 
 // ─────────────────────────────────────────────
 // Auth — check session on load
@@ -206,7 +208,7 @@ async function loadDashboard() {
 // ─────────────────────────────────────────────
 async function loadCourses() {
     try {
-        const response = await fetch(`${API_URL}/courses`, {
+        const response = await fetch(`${API_URL}/courses?lang=${currentLanguage}`, {
             credentials: 'include'
         });
         const courses = await response.json();
@@ -214,9 +216,9 @@ async function loadCourses() {
         const container = document.getElementById('courses-list');
         container.innerHTML = courses.map(course => `
             <div class="course-card" onclick="viewCourse(${course.id})">
-                <div class="course-title">${course['title_' + currentLanguage]}</div>
+                <div class="course-title">${course.title}</div>
                 <span class="course-level level-${course.level}">${course.level}</span>
-                <div class="course-description">${course['description_' + currentLanguage]}</div>
+                <div class="course-description">${course.description}</div>
                 <div class="progress-bar">
                     <div class="progress-fill" style="width: ${course.progress || 0}%"></div>
                 </div>
@@ -236,23 +238,25 @@ async function loadCourses() {
 async function viewCourse(courseId) {
     currentCourseId = courseId;
     try {
-        const response = await fetch(`${API_URL}/courses/${courseId}`, {
+        // One request for the whole course; lessons then open without a round trip
+        const response = await fetch(`${API_URL}/courses/${courseId}/bundle?lang=${currentLanguage}`, {
             credentials: 'include'
         });
-        const course = await response.json();
+        currentBundle = await response.json();
+        const course = currentBundle.course;
 
         const content = document.getElementById('course-detail-content');
         content.innerHTML = `
             <div class="card">
-                <h1 style="font-size: 2rem; font-weight: 900; margin-bottom: 10px;">${course['title_' + currentLanguage]}</h1>
+                <h1 style="font-size: 2rem; font-weight: 900; margin-bottom: 10px;">${course.title}</h1>
                 <span class="course-level level-${course.level}">${course.level}</span>
-                <p style="color: var(--ink-medium); margin: 20px 0;">${course['description_' + currentLanguage]}</p>
+                <p style="color: var(--ink-medium); margin: 20px 0;">${course.description}</p>
                 
                 <h2 style="margin: 30px 0 15px; font-weight: 700;">Lessons</h2>
                 <ul class="lesson-list">
-                    ${course.lessons.map(lesson => `
+                    ${currentBundle.lessons.map(lesson => `
                         <li class="lesson-item" onclick="viewLesson(${lesson.id})">
-                            <div style="font-weight: 700; margin-bottom: 5px;">${lesson['title_' + currentLanguage]}</div>
+                            <div style="font-weight: 700; margin-bottom: 5px;">${lesson.title}</div>
                             <div style="font-size: 0.85rem; color: var(--ink-light);">Lesson ${lesson.lesson_order}</div>
                         </li>
                     `).join('')}
@@ -276,17 +280,20 @@ async function viewCourse(courseId) {
 async function viewLesson(lessonId) {
     currentLessonId = lessonId;
     try {
-        const response = await fetch(`${API_URL}/lessons/${lessonId}`, {
-            credentials: 'include'
-        });
-        const lesson = await response.json();
+        let lesson = currentBundle && currentBundle.lessons.find(l => l.id === lessonId);
+        if (!lesson) {
+            const response = await fetch(`${API_URL}/lessons/${lessonId}?lang=${currentLanguage}`, {
+                credentials: 'include'
+            });
+            lesson = await response.json();
+        }
 
         const content = document.getElementById('lesson-content');
         content.innerHTML = `
             <div class="card">
-                <h1 style="font-size: 2rem; font-weight: 900; margin-bottom: 20px;">${lesson['title_' + currentLanguage]}</h1>
+                <h1 style="font-size: 2rem; font-weight: 900; margin-bottom: 20px;">${lesson.title}</h1>
                 <div style="color: var(--ink-dark); line-height: 1.8; margin-bottom: 30px;">
-                    ${lesson['content_' + currentLanguage] || 'Lesson content...'}
+                    ${lesson.content || 'Lesson content...'}
                 </div>
 
                 <h2 style="margin-bottom: 20px; font-weight: 700;">Vocabulary</h2>
@@ -296,9 +303,9 @@ async function viewLesson(lessonId) {
                             <div class="word-kazakh">${word.kazakh}</div>
                             <div class="word-translation">${currentLanguage === 'en' ? word.english : word.russian}</div>
                             <div class="word-pronunciation">[${word.pronunciation}]</div>
-                            ${word['example_sentence_' + currentLanguage] ? `
+                            ${word.example_sentence ? `
                                 <div class="word-example">
-                                    ${word['example_sentence_' + currentLanguage]}
+                                    ${word.example_sentence}
                                 </div>
                             ` : ''}
                             <button class="btn btn-secondary" style="margin-top: 10px; font-size: 0.85rem; padding: 8px;" 
@@ -362,7 +369,7 @@ async function completeLesson(lessonId) {
 // ─────────────────────────────────────────────
 async function loadGrammar() {
     try {
-        const response = await fetch(`${API_URL}/grammar`, {
+        const response = await fetch(`${API_URL}/grammar?lang=${currentLanguage}`, {
             credentials: 'include'
         });
         const rules = await response.json();
@@ -370,8 +377,8 @@ async function loadGrammar() {
         const container = document.getElementById('grammar-list');
         container.innerHTML = rules.map(rule => `
             <div class="grammar-card">
-                <div class="grammar-title">${rule['title_' + currentLanguage]}</div>
-                <div class="grammar-explanation">${rule['explanation_' + currentLanguage]}</div>
+                <div class="grammar-title">${rule.title}</div>
+                <div class="grammar-explanation">${rule.explanation}</div>
                 ${rule.examples ? `
                     <div class="grammar-examples">
                         <strong>Examples:</strong>
@@ -392,7 +399,7 @@ async function loadGrammar() {
 // ─────────────────────────────────────────────
 async function loadMyWords() {
     try {
-        const response = await fetch(`${API_URL}/words/learned`, {
+        const response = await fetch(`${API_URL}/words/learned?lang=${currentLanguage}`, {
             credentials: 'include'
         });
         const words = await response.json();
@@ -411,9 +418,9 @@ async function loadMyWords() {
                         <div class="word-kazakh">${word.kazakh}</div>
                         <div class="word-translation">${currentLanguage === 'en' ? word.english : word.russian}</div>
                         <div class="word-pronunciation">[${word.pronunciation}]</div>
-                        ${word['example_sentence_' + currentLanguage] ? `
+                        ${word.example_sentence ? `
                             <div class="word-example">
-                                ${word['example_sentence_' + currentLanguage]}
+                                ${word.example_sentence}
                             </div>
                         ` : ''}
                     </div>
@@ -430,12 +437,14 @@ async function loadMyWords() {
 // ─────────────────────────────────────────────
 async function startTest(courseId) {
     try {
-        const response = await fetch(`${API_URL}/courses/${courseId}/test`, {
+        const response = await fetch(`${API_URL}/courses/${courseId}/test?lang=${currentLanguage}`, {
             credentials: 'include'
         });
-        const questions = await response.json();
+        const test = await response.json();
+        const questions = test.questions;
 
         testAnswers = {};
+        testToken = test.token;
 
         const content = document.getElementById('test-content');
         content.innerHTML = `
@@ -443,7 +452,7 @@ async function startTest(courseId) {
                 <h1 style="font-size: 2rem; font-weight: 900; margin-bottom: 30px;">Course Test</h1>
                 ${questions.map((q, index) => `
                     <div class="test-question">
-                        <div class="question-text">${index + 1}. ${q['question_text_' + currentLanguage]}</div>
+                        <div class="question-text">${index + 1}. ${q.question_text}</div>
                         ${q.question_type === 'multiple_choice' ? `
                             <div class="question-options">
                                 ${q.options.map(option => `
@@ -487,7 +496,7 @@ async function submitTest(courseId) {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             credentials: 'include',
-            body: JSON.stringify({ answers: testAnswers })
+            body: JSON.stringify({ answers: testAnswers, token: testToken })
         });
         const result = await response.json();
 
@@ -545,6 +554,7 @@ function backToCourseDetail() {
 // ─────────────────────────────────────────────
 function switchLanguage(lang) {
     currentLanguage = lang;
+    currentBundle = null;
 
     document.querySelectorAll('.lang-btn').forEach(btn => {
         btn.classList.remove('active');
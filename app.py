@@ -1,35 +1,347 @@
-from flask import Flask, request, jsonify, session, send_from_directory
+from flask import (Flask, Response, request, jsonify, session, g, send_file,
+                   stream_with_context)
 from flask_cors import CORS
+from itsdangerous import BadSignature, URLSafeTimedSerializer
 import sqlite3
 import hashlib
 from datetime import datetime, timedelta
 import json
 import os
+import base64
+import binascii
+import gc
+import functools
+import time
+import secrets
 
-app = Flask(__name__, static_folder='.')
+from bundles import BundleStore
+from catalog import LANGUAGES, CatalogStore
+from database import ensure_schema
+from game import DEFAULT_ROUNDS, MAX_ROUNDS, RoundGenerator, grade_game
+from db_pool import ConnectionPool
+from grading import GradingEngine, TestSampler
+from leaderboard import GLOBAL_BOARDS, Leaderboards
+from metrics import InstrumentedConnection, Metrics, SQLStats
+from response_cache import ResponseCache
+from slow_query_log import SlowQueryLog
+from static_assets import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, AssetTable
+import search
+import srs
+import sync
+from trophy_engine import TrophyEngine
+from write_queue import WriteBehindQueue
+
+app = Flask(__name__, static_folder=None)
 app.secret_key = 'your-secret-key-change-in-production'
 CORS(app, supports_credentials=True)
 
+# Database settings, overridable through KAZAKH_* environment variables
+app.config.update(
+    DATABASE=os.environ.get('KAZAKH_DATABASE', 'kazakh_learning.db'),
+    DB_POOL_SIZE=int(os.environ.get('KAZAKH_DB_POOL_SIZE', 8)),
+    DB_POOL_TIMEOUT=float(os.environ.get('KAZAKH_DB_POOL_TIMEOUT', 5.0)),
+    DB_CACHED_STATEMENTS=int(os.environ.get('KAZAKH_DB_CACHED_STATEMENTS', 256)),
+    DB_SYNCHRONOUS=os.environ.get('KAZAKH_DB_SYNCHRONOUS', 'NORMAL'),
+    DB_CACHE_SIZE=int(os.environ.get('KAZAKH_DB_CACHE_SIZE', -16000)),
+    DB_MMAP_SIZE=int(os.environ.get('KAZAKH_DB_MMAP_SIZE', 268435456)),
+    DB_BUSY_TIMEOUT=int(os.environ.get('KAZAKH_DB_BUSY_TIMEOUT', 5000)),
+    CATALOG_CHECK_INTERVAL=float(os.environ.get('KAZAKH_CATALOG_CHECK_INTERVAL', 1.0)),
+    RESPONSE_CACHE_BYTES=int(os.environ.get('KAZAKH_RESPONSE_CACHE_BYTES', 16 * 1024 * 1024)),
+    WRITE_QUEUE_INTERVAL_MS=int(os.environ.get('KAZAKH_WRITE_QUEUE_INTERVAL_MS', 200)),
+    WRITE_QUEUE_BATCH_SIZE=int(os.environ.get('KAZAKH_WRITE_QUEUE_BATCH_SIZE', 100)),
+    WRITE_QUEUE_MAX_PENDING=int(os.environ.get('KAZAKH_WRITE_QUEUE_MAX_PENDING', 10000)),
+    LEADERBOARD_POLL_INTERVAL=float(os.environ.get('KAZAKH_LEADERBOARD_POLL_INTERVAL', 0.5)),
+    METRICS_ENABLED=os.environ.get('KAZAKH_METRICS', '1') != '0',
+    # Log requests issuing more SQL statements than this (0 disables)
+    SQL_STATEMENT_BUDGET=int(os.environ.get('KAZAKH_SQL_STATEMENT_BUDGET', 0)),
+    # Statements slower than this go to the slow query log (0 disables);
+    # needs METRICS_ENABLED for the instrumented connections
+    SLOW_QUERY_MS=float(os.environ.get('KAZAKH_SLOW_QUERY_MS', 100)),
+    SLOW_QUERY_LOG=os.environ.get('KAZAKH_SLOW_QUERY_LOG', 'slow_queries.ndjson'),
+    SLOW_QUERY_LOG_BYTES=int(os.environ.get('KAZAKH_SLOW_QUERY_LOG_BYTES', 10 * 1024 * 1024)),
+    # Questions per course test, and how long an issued test can be submitted
+    TEST_QUESTIONS=int(os.environ.get('KAZAKH_TEST_QUESTIONS', 20)),
+    TEST_TOKEN_MAX_AGE=int(os.environ.get('KAZAKH_TEST_TOKEN_MAX_AGE', 2 * 60 * 60)),
+    # How long a batch of name game rounds can be played and submitted
+    GAME_TOKEN_MAX_AGE=int(os.environ.get('KAZAKH_GAME_TOKEN_MAX_AGE', 60 * 60)),
+    # Prebuilt course bundles, written by the publishing command for each
+    # catalog version (database.py setup/import/generate, bundles.py)
+    BUNDLE_DIR=os.environ.get('KAZAKH_BUNDLE_DIR', 'bundles'),
+    # Sync tokens older than this fall back to a full snapshot
+    SYNC_RETENTION_DAYS=int(os.environ.get('KAZAKH_SYNC_RETENTION_DAYS', 30)),
+)
+
 # ============= STATIC FILE SERVING =============
 
 @app.route('/')
 def serve_index():
-    return send_from_directory('.', 'index.html')
+    return send_asset('index.html')
 
 @app.route('/<path:path>')
 def serve_static(path):
-    """Serve static files (CSS, JS, images) from root directory"""
-    if os.path.exists(path) and not path.startswith('api'):
-        return send_from_directory('.', path)
-    return send_from_directory('.', 'index.html')
+    """Serve static files (CSS, JS, images) from the in-memory asset table"""
+    return send_asset(path)
+
+def send_asset(path):
+    """Response for a static asset, negotiating br/gzip and honouring
+    If-None-Match; fingerprinted URLs are cacheable forever"""
+    asset, immutable = static_assets.lookup(path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    coding = asset.negotiate(request.accept_encodings)
+    etag = asset.etag if coding == 'identity' else '%s-%s' % (asset.etag, coding)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(asset.encodings[coding], content_type=asset.mimetype)
+        if coding != 'identity':
+            response.headers['Content-Encoding'] = coding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = (
+        IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL)
+    return response
+
+DATABASE = app.config['DATABASE']
+
+# Bring an existing database up to the current schema before serving
+ensure_schema(DATABASE)
+
+db_pool = ConnectionPool(
+    DATABASE,
+    size=app.config['DB_POOL_SIZE'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+    cached_statements=app.config['DB_CACHED_STATEMENTS'],
+    pragmas={
+        'journal_mode': 'WAL',
+        'synchronous': app.config['DB_SYNCHRONOUS'],
+        'cache_size': app.config['DB_CACHE_SIZE'],
+        'mmap_size': app.config['DB_MMAP_SIZE'],
+        'busy_timeout': app.config['DB_BUSY_TIMEOUT'],
+    },
+    factory=InstrumentedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection,
+)
+
+# Read-mostly course content is loaded once at import, so under
+# `gunicorn --preload` every worker shares the snapshot copy-on-write.
+# gc.freeze() keeps the collector from touching (and un-sharing) those pages.
+catalog_store = CatalogStore(DATABASE, check_interval=app.config['CATALOG_CHECK_INTERVAL'])
+
+# Serialized catalog responses, keyed by endpoint, arguments and catalog
+# version, and dropped whenever a new catalog snapshot is swapped in
+response_cache = ResponseCache(max_bytes=app.config['RESPONSE_CACHE_BYTES'])
+catalog_store.on_reload(response_cache.invalidate)
+
+# Trophy rules are indexed from the catalog snapshot and rebuilt with it
+trophy_engine = TrophyEngine()
+catalog_store.on_reload(trophy_engine.load)
+
+# Compiled test answer keys are tied to the catalog version they came from
+grading_engine = GradingEngine()
+catalog_store.on_reload(grading_engine.reset)
+
+# Stratified question samples for course tests
+test_sampler = TestSampler()
+catalog_store.on_reload(test_sampler.reset)
+
+# Course bundles are prebuilt on disk when the catalog is published; a
+# reload only reads the version's manifest, and files are served with sendfile
+course_bundles = BundleStore(app.config['BUNDLE_DIR'])
+catalog_store.on_reload(course_bundles.load)
+
+# Name game rounds are drawn from a distractor index over the catalog words
+round_generator = RoundGenerator()
+catalog_store.on_reload(round_generator.load)
+
+# In-memory rankings, built here so preloaded workers share them and then
+# kept current from the trigger-fed leaderboard_changes log
+leaderboards = Leaderboards(DATABASE, poll_interval=app.config['LEADERBOARD_POLL_INTERVAL'])
+
+# Static files are read, fingerprinted and precompressed once; requests
+# never touch the filesystem
+static_assets = AssetTable(os.path.dirname(os.path.abspath(__file__))).build()
+
+catalog_store.load()
+leaderboards.rebuild()
+gc.freeze()
+
+def send_cached(entry):
+    """Build a response from a cache entry, honouring If-None-Match and gzip;
+    the gzipped representation has its own ETag, as for static assets"""
+    gzipped = entry.gzip_body is not None and bool(request.accept_encodings['gzip'])
+    etag = '%s-gzip' % entry.etag if gzipped else entry.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif gzipped:
+        response = Response(entry.gzip_body, mimetype=entry.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(entry.body, mimetype=entry.mimetype)
+    response.set_etag(etag)
+    if request.args.get('lang') == 'auto':
+        response.headers['Vary'] = 'Accept-Encoding, Accept-Language'
+    else:
+        response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+LANGUAGE_ERROR = 'lang must be one of en, kk, ru or auto'
 
-DATABASE = 'kazakh_learning.db'
+def request_language():
+    """Language to project catalog rows to, from ?lang=.
+    
+    en, kk or ru return flattened `title`/`content`/... fields in that
+    language, `auto` picks one from Accept-Language, and no lang keeps every
+    language's columns. Raises ValueError for anything else.
+    """
+    lang = request.args.get('lang')
+    if lang == 'auto':
+        return request.accept_languages.best_match(LANGUAGES, default='en')
+    if lang is not None and lang not in LANGUAGES:
+        raise ValueError(LANGUAGE_ERROR)
+    return lang
+
+def cached_catalog_response(per_user=False):
+    """Serve a catalog view from the response cache.
+
+    Views marked per_user mix in data for the logged-in user, so they are
+    only cached for anonymous requests. Non-200 responses are never cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if per_user and 'user_id' in session:
+                return view(**kwargs)
+            try:
+                lang = request_language()
+            except ValueError:
+                return view(**kwargs)
+            
+            # lang=auto depends on Accept-Language, so key on the resolved one
+            key = (request.endpoint,
+                   tuple(sorted(kwargs.items())),
+                   tuple(sorted(request.args.items(multi=True))),
+                   lang,
+                   catalog_store.current().version)
+            entry = response_cache.get(key)
+            if entry is None:
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.put(key, response.get_data(), response.mimetype)
+            return send_cached(entry)
+        return wrapper
+    return decorator
+
+# Non-critical writes (e.g. last_login) are coalesced per user and
+# group-committed by a background flusher so they do not contend for the
+# SQLite write lock with progress and test results
+write_queue = WriteBehindQueue(
+    DATABASE,
+    interval_ms=app.config['WRITE_QUEUE_INTERVAL_MS'],
+    batch_size=app.config['WRITE_QUEUE_BATCH_SIZE'],
+    max_pending=app.config['WRITE_QUEUE_MAX_PENDING'],
+    busy_timeout=app.config['DB_BUSY_TIMEOUT'],
+)
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get the request's pooled database connection"""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+        if app.config['METRICS_ENABLED']:
+            g.db.observer = g.get('sql_stats')
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception):
+    """Return the request's connection to the pool"""
+    conn = g.pop('db', None)
+    if conn is not None:
+        if app.config['METRICS_ENABLED']:
+            conn.observer = None
+        db_pool.release(conn)
+
+# ============= METRICS =============
+
+# Per-endpoint request counts, latency and SQL statement counts/time,
+# collected from the instrumented connections handed out by get_db()
+metrics = Metrics()
+
+# Slow statements with their EXPLAIN QUERY PLAN, summarized with
+# `python slow_query_log.py summarize`
+slow_query_log = SlowQueryLog(
+    app.config['SLOW_QUERY_LOG'],
+    threshold_ms=app.config['SLOW_QUERY_MS'],
+    max_bytes=app.config['SLOW_QUERY_LOG_BYTES'],
+)
+
+def log_slow_statement(sql, parameters, seconds):
+    slow_query_log.record(g.db, sql, parameters, seconds, request.endpoint)
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        g.request_started = time.perf_counter()
+        if app.config['SLOW_QUERY_MS'] > 0:
+            g.sql_stats = SQLStats(slow_query_log.threshold, log_slow_statement)
+        else:
+            g.sql_stats = SQLStats()
+
+@app.after_request
+def record_request_metrics(response):
+    sql = g.get('sql_stats')
+    if sql is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    metrics.record(endpoint, request.method, response.status_code,
+                   time.perf_counter() - g.request_started, sql)
+    budget = app.config['SQL_STATEMENT_BUDGET']
+    if budget and sql.statements > budget:
+        app.logger.warning('%s %s (%s) issued %d SQL statements, budget %d (%.1f ms in SQL)',
+                           request.method, request.path, endpoint, sql.statements, budget,
+                           sql.seconds * 1000)
+    return response
+
+def metric_gauges():
+    """(name, help, type, value) for the pool, caches, queues and catalog"""
+    pool = db_pool.stats()
+    cache = response_cache.stats()
+    queue = write_queue.stats()
+    return [
+        ('db_pool_size', 'Maximum pooled connections', 'gauge', pool['size']),
+        ('db_pool_open', 'Open pooled connections', 'gauge', pool['open']),
+        ('db_pool_in_use', 'Pooled connections checked out', 'gauge', pool['in_use']),
+        ('db_pool_hits_total', 'Acquires served by an idle connection', 'counter', pool['hits']),
+        ('db_pool_misses_total', 'Acquires that opened a connection', 'counter', pool['misses']),
+        ('db_pool_waits_total', 'Acquires that had to wait', 'counter', pool['waits']),
+        ('db_pool_timeouts_total', 'Acquires that timed out', 'counter', pool['timeouts']),
+        ('response_cache_entries', 'Cached responses', 'gauge', cache['entries']),
+        ('response_cache_bytes', 'Bytes held by the response cache', 'gauge', cache['bytes']),
+        ('response_cache_hits_total', 'Response cache hits', 'counter', cache['hits']),
+        ('response_cache_misses_total', 'Response cache misses', 'counter', cache['misses']),
+        ('response_cache_evictions_total', 'Response cache evictions', 'counter',
+         cache['evictions']),
+        ('write_queue_depth', 'Writes waiting to be flushed', 'gauge', queue['depth']),
+        ('write_queue_flushes_total', 'Write queue group commits', 'counter', queue['flushes']),
+        ('write_queue_flushed_writes_total', 'Writes committed by the flusher', 'counter',
+         queue['flushed_writes']),
+        ('write_queue_coalesced_total', 'Writes replaced by a newer one before flushing',
+         'counter', queue['coalesced']),
+        ('write_queue_errors_total', 'Failed write queue flushes', 'counter', queue['errors']),
+        ('write_queue_last_flush_seconds', 'Duration of the last flush', 'gauge',
+         queue['last_flush_ms'] / 1000.0),
+        ('slow_queries_total', 'Statements written to the slow query log', 'counter',
+         slow_query_log.logged),
+        ('catalog_version', 'Catalog snapshot version being served', 'gauge',
+         catalog_store.current().version),
+        ('course_bundle_builds_total', 'Course bundle rebuilds', 'counter',
+         course_bundles.builds),
+    ]
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(metrics.render(metric_gauges(), labels={'pid': os.getpid()}),
+                    mimetype='text/plain; version=0.0.4')
 
 def hash_password(password):
     """Hash password using SHA256"""
@@ -66,8 +378,6 @@ def register():
         return jsonify({'message': 'User registered successfully', 'user_id': user_id}), 201
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Username or email already exists'}), 400
-    finally:
-        conn.close()
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -84,23 +394,45 @@ def login():
     
     password_hash = hash_password(password)
     cursor.execute('''
-    SELECT id, username, email FROM users 
+    SELECT id, username, email, last_login FROM users 
     WHERE username = ? AND password_hash = ?
     ''', (username, password_hash))
     
     user = cursor.fetchone()
     
     if user:
-        # Update last login
-        cursor.execute('''
-        UPDATE users SET last_login = ? WHERE id = ?
-        ''', (datetime.now(), user['id']))
-        conn.commit()
+        now = datetime.now()
+        
+        last_day = str(user['last_login'] or '')[:10]
+        today = now.date()
+        if last_day != today.isoformat():
+            # The first login of a day extends or restarts the streak and
+            # records last_login in the same UPDATE, so the day change is
+            # committed before the next login can see it
+            continued = last_day == (today - timedelta(days=1)).isoformat()
+            cursor.execute('''
+            UPDATE users SET
+                streak_days = CASE WHEN ? THEN streak_days + 1 ELSE 1 END,
+                last_login = ?
+            WHERE id = ?
+            RETURNING streak_days
+            ''', (continued, now, user['id']))
+            streak = cursor.fetchone()['streak_days']
+            trophy_engine.evaluate(cursor, user['id'], 'streak_days',
+                                   streak - 1 if continued else 0, streak)
+            conn.commit()
+        else:
+            # Later logins that day only move last_login, off the request
+            # path; repeated logins before the next flush collapse into one.
+            # MAX keeps a write flushed after midnight from moving it back
+            # behind the next day's first login.
+            write_queue.submit(('last_login', user['id']), '''
+            UPDATE users SET last_login = MAX(COALESCE(last_login, ''), ?) WHERE id = ?
+            ''', (now, user['id']))
         
         session['user_id'] = user['id']
         session['username'] = user['username']
         
-        conn.close()
         return jsonify({
             'message': 'Login successful',
             'user': {
@@ -110,7 +442,6 @@ def login():
             }
         }), 200
     else:
-        conn.close()
         return jsonify({'error': 'Invalid credentials'}), 401
 
 @app.route('/api/logout', methods=['POST'])
@@ -137,7 +468,6 @@ def get_user_profile():
     ''', (session['user_id'],))
     
     user = cursor.fetchone()
-    conn.close()
     
     if user:
         return jsonify(dict(user)), 200
@@ -183,7 +513,6 @@ def get_user_stats():
     
     stats['earned_trophies'] = [dict(row) for row in cursor.fetchall()]
     
-    conn.close()
     return jsonify(stats), 200
 
 @app.route('/api/user/update', methods=['PUT'])
@@ -207,33 +536,39 @@ def update_user():
                       (data['current_theme'], session['user_id']))
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Profile updated successfully'}), 200
 
 # ============= COURSES ENDPOINTS =============
 
 @app.route('/api/courses', methods=['GET'])
+@cached_catalog_response(per_user=True)
 def get_courses():
     """Get all courses"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-    SELECT * FROM courses ORDER BY order_index
-    ''')
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    courses = [dict(row) for row in cursor.fetchall()]
+    catalog = catalog_store.current()
+    courses = catalog.courses.dicts(catalog.course_order, lang)
     
-    # If user is logged in, get their progress
+    # If user is logged in, count their completed lessons per course in one
+    # grouped query instead of one COUNT(*) per course
     if 'user_id' in session:
+        conn = get_db()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+        SELECT course_id, COUNT(*) AS completed FROM user_progress
+        WHERE user_id = ? AND completed = 1
+        GROUP BY course_id
+        ''', (session['user_id'],))
+        
+        completed_by_course = {row['course_id']: row['completed'] for row in cursor.fetchall()}
+        
         for course in courses:
-            cursor.execute('''
-            SELECT COUNT(*) as completed FROM user_progress
-            WHERE user_id = ? AND course_id = ? AND completed = 1
-            ''', (session['user_id'], course['id']))
-            
-            completed = cursor.fetchone()['completed']
+            completed = completed_by_course.get(course['id'], 0)
             total_lessons = course['total_lessons']
             
             if total_lessons > 0:
@@ -243,93 +578,132 @@ def get_courses():
             
             course['completed_lessons'] = completed
     
-    conn.close()
     return jsonify(courses), 200
 
 @app.route('/api/courses/<int:course_id>', methods=['GET'])
+@cached_catalog_response()
 def get_course(course_id):
     """Get specific course details"""
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    cursor.execute('SELECT * FROM courses WHERE id = ?', (course_id,))
-    course = cursor.fetchone()
+    catalog = catalog_store.current()
+    course = catalog.courses.get(course_id)
     
     if not course:
-        conn.close()
         return jsonify({'error': 'Course not found'}), 404
     
-    course = dict(course)
+    course = catalog.courses.as_dict(course, lang)
+    course['lessons'] = catalog.lessons.dicts(catalog.lessons_by_course.get(course_id, ()), lang)
     
-    # Get lessons
-    cursor.execute('''
-    SELECT * FROM lessons WHERE course_id = ? ORDER BY lesson_order
-    ''', (course_id,))
+    return jsonify(course), 200
+
+@app.route('/api/courses/<int:course_id>/bundle', methods=['GET'])
+def get_course_bundle(course_id):
+    """Course, lessons, words and the level's grammar rules in one prebuilt
+    payload; the ETag hashes the served bytes, so clients holding the
+    current version get 304"""
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    course['lessons'] = [dict(row) for row in cursor.fetchall()]
+    catalog_store.current()
+    bundle = course_bundles.get(course_id, lang)
+    if bundle is None:
+        return jsonify({'error': 'Course not found'}), 404
     
-    conn.close()
-    return jsonify(course), 200
+    gzipped = bool(request.accept_encodings['gzip'])
+    etag = '%s-gzip' % bundle.etag if gzipped else bundle.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = send_file(bundle.gzip_path if gzipped else bundle.path,
+                             mimetype='application/json', etag=False, conditional=False,
+                             max_age=None)
+        if gzipped:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    if request.args.get('lang') == 'auto':
+        response.headers['Vary'] = 'Accept-Encoding, Accept-Language'
+    else:
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return response
 
 @app.route('/api/lessons/<int:lesson_id>', methods=['GET'])
+@cached_catalog_response()
 def get_lesson(lesson_id):
     """Get specific lesson with words"""
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    cursor.execute('SELECT * FROM lessons WHERE id = ?', (lesson_id,))
-    lesson = cursor.fetchone()
+    catalog = catalog_store.current()
+    lesson = catalog.lessons.get(lesson_id)
     
     if not lesson:
-        conn.close()
         return jsonify({'error': 'Lesson not found'}), 404
     
-    lesson = dict(lesson)
-    
-    # Get words for this lesson
-    cursor.execute('''
-    SELECT * FROM words WHERE lesson_id = ?
-    ''', (lesson_id,))
-    
-    lesson['words'] = [dict(row) for row in cursor.fetchall()]
+    lesson = catalog.lessons.as_dict(lesson, lang)
+    lesson['words'] = catalog.words.dicts(catalog.words_by_lesson.get(lesson_id, ()), lang)
     
-    conn.close()
     return jsonify(lesson), 200
 
+def record_lesson_completion(cursor, user_id, lesson_id):
+    """Mark a lesson completed; False if the lesson does not exist"""
+    lessons = catalog_store.current().lessons
+    lesson = lessons.get(lesson_id)
+    if lesson is None:
+        return False
+    
+    # completed_at is UTC, like the date('now', ...) bounds of weekly XP
+    cursor.execute('''
+    INSERT OR REPLACE INTO user_progress (user_id, course_id, lesson_id, completed, completed_at)
+    VALUES (?, ?, ?, 1, ?)
+    ''', (user_id, lesson[lessons.col('course_id')], lesson_id, datetime.utcnow()))
+    return True
+
 @app.route('/api/lessons/<int:lesson_id>/complete', methods=['POST'])
-def complete_lesson():
+def complete_lesson(lesson_id):
     """Mark lesson as completed"""
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    lesson_id = request.view_args['lesson_id']
-    
     conn = get_db()
     cursor = conn.cursor()
     
-    # Get course_id from lesson
-    cursor.execute('SELECT course_id FROM lessons WHERE id = ?', (lesson_id,))
-    result = cursor.fetchone()
-    
-    if not result:
-        conn.close()
+    if not record_lesson_completion(cursor, session['user_id'], lesson_id):
         return jsonify({'error': 'Lesson not found'}), 404
     
-    course_id = result['course_id']
-    
-    # Mark as completed
-    cursor.execute('''
-    INSERT OR REPLACE INTO user_progress (user_id, course_id, lesson_id, completed, completed_at)
-    VALUES (?, ?, ?, 1, ?)
-    ''', (session['user_id'], course_id, lesson_id, datetime.now()))
-    
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Lesson completed successfully'}), 200
 
 # ============= WORDS ENDPOINTS =============
 
+# Counters on users (total_words_learned, total_trophies) are maintained by
+# triggers on user_learned_words and user_trophies, so learning a word is a
+# single upsert rather than a re-count of the user's whole vocabulary.
+# Once a word is learned its proficiency follows the review scheduler
+# (consecutive successful reviews, like repetitions), so learning it again
+# only refreshes learned_at.
+LEARN_WORD_SQL = '''
+INSERT INTO user_learned_words (user_id, word_id, proficiency, due_at)
+VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+ON CONFLICT(user_id, word_id) DO UPDATE SET
+    learned_at = CURRENT_TIMESTAMP
+'''
+
+MAX_BATCH_WORDS = 500
+
+def learned_word_total(cursor, user_id):
+    cursor.execute('SELECT total_words_learned FROM users WHERE id = ?', (user_id,))
+    return cursor.fetchone()['total_words_learned']
+
 @app.route('/api/words/learn', methods=['POST'])
 def learn_word():
     """Mark word as learned"""
@@ -342,119 +716,515 @@ def learn_word():
     if not word_id:
         return jsonify({'error': 'Word ID required'}), 400
     
+    try:
+        word_id = int(word_id)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid word ID'}), 400
+    
+    if word_id not in catalog_store.current().words.index:
+        return jsonify({'error': 'Word not found'}), 404
+    
     conn = get_db()
     cursor = conn.cursor()
     
-    cursor.execute('''
-    INSERT OR REPLACE INTO user_learned_words (user_id, word_id, proficiency)
-    VALUES (?, ?, ?)
-    ''', (session['user_id'], word_id, 1))
+    before = learned_word_total(cursor, session['user_id'])
+    cursor.execute(LEARN_WORD_SQL, (session['user_id'], word_id, 1))
+    after = learned_word_total(cursor, session['user_id'])
     
-    # Update total words learned count
-    cursor.execute('''
-    UPDATE users SET total_words_learned = (
-        SELECT COUNT(*) FROM user_learned_words WHERE user_id = ?
-    )
-    WHERE id = ?
-    ''', (session['user_id'], session['user_id']))
+    trophies = trophy_engine.evaluate(cursor, session['user_id'], 'words_learned', before, after)
+    
+    conn.commit()
+    
+    return jsonify({'message': 'Word learned successfully', 'trophies_awarded': trophies}), 200
+
+@app.route('/api/words/learn/batch', methods=['POST'])
+def learn_words_batch():
+    """Mark several words as learned in one transaction
+
+    Accepts {"words": [1, 2, {"word_id": 3, "proficiency": 2}, ...]}.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.json or {}
+    words = data.get('words')
+    
+    if not isinstance(words, list) or not words:
+        return jsonify({'error': 'Word list required'}), 400
+    if len(words) > MAX_BATCH_WORDS:
+        return jsonify({'error': 'At most %d words per batch' % MAX_BATCH_WORDS}), 400
+    
+    known = catalog_store.current().words.index
+    rows = {}
+    unknown = []
+    
+    for item in words:
+        if isinstance(item, dict):
+            word_id = item.get('word_id')
+            proficiency = item.get('proficiency', 1)
+        else:
+            word_id, proficiency = item, 1
+        try:
+            word_id = int(word_id)
+            proficiency = int(proficiency)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Invalid word entry: %r' % (item,)}), 400
+        
+        if word_id in known:
+            # Later entries for the same word win
+            rows[word_id] = (session['user_id'], word_id, proficiency)
+        else:
+            unknown.append(word_id)
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    before = learned_word_total(cursor, session['user_id'])
+    cursor.executemany(LEARN_WORD_SQL, list(rows.values()))
+    total = learned_word_total(cursor, session['user_id'])
+    
+    trophies = trophy_engine.evaluate(cursor, session['user_id'], 'words_learned', before, total)
     
     conn.commit()
-    conn.close()
     
-    return jsonify({'message': 'Word learned successfully'}), 200
+    return jsonify({
+        'message': 'Words learned successfully',
+        'learned': len(rows),
+        'unknown_word_ids': unknown,
+        'total_words_learned': total,
+        'trophies_awarded': trophies
+    }), 200
+
+# Learned words are read newest first by keyset on (learned_at, word_id).
+# Both queries are answered from the covering index
+# idx_user_learned_words_learned; word content comes from the catalog.
+LEARNED_WORDS_FIRST_SQL = '''
+SELECT word_id, learned_at, proficiency FROM user_learned_words
+WHERE user_id = ?
+ORDER BY learned_at DESC, word_id DESC
+LIMIT ?
+'''
+
+LEARNED_WORDS_AFTER_SQL = '''
+SELECT word_id, learned_at, proficiency FROM user_learned_words
+WHERE user_id = ? AND (learned_at, word_id) < (?, ?)
+ORDER BY learned_at DESC, word_id DESC
+LIMIT ?
+'''
+
+LEARNED_WORDS_DEFAULT_LIMIT = 100
+LEARNED_WORDS_MAX_LIMIT = 1000
+LEARNED_WORDS_STREAM_CHUNK = 500
+
+def encode_cursor(values):
+    """Opaque pagination token for a keyset position"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor(); raises ValueError on a malformed token"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        return json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError):
+        raise ValueError('Invalid cursor')
+
+def fetch_learned_words(cursor, user_id, after, limit):
+    """One keyset page of (word_id, learned_at, proficiency) rows"""
+    if after is None:
+        cursor.execute(LEARNED_WORDS_FIRST_SQL, (user_id, limit))
+    else:
+        cursor.execute(LEARNED_WORDS_AFTER_SQL, (user_id, after[0], after[1], limit))
+    return cursor.fetchall()
+
+def learned_word_dicts(catalog, rows, lang=None):
+    words = []
+    for row in rows:
+        word = catalog.words.get(row['word_id'])
+        if word is None:
+            continue
+        word = catalog.words.as_dict(word, lang)
+        word['learned_at'] = row['learned_at']
+        word['proficiency'] = row['proficiency']
+        words.append(word)
+    return words
 
 @app.route('/api/words/learned', methods=['GET'])
 def get_learned_words():
-    """Get all learned words for current user"""
+    """Get learned words for current user, newest first
+
+    Without parameters the full list is returned as before. With `limit`
+    and/or `cursor` one page is returned as {"words": [...], "next": token},
+    and `format=ndjson` streams every word from `cursor` on, one per line.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
+    user_id = session['user_id']
+    token = request.args.get('cursor')
+    
+    try:
+        after = decode_cursor(token) if token else None
+        # A (learned_at, word_id) keyset position: anything else would reach
+        # SQLite as an unbindable parameter
+        if after is not None and not (
+                isinstance(after, list) and len(after) == 2
+                and isinstance(after[0], str)
+                and isinstance(after[1], int) and not isinstance(after[1], bool)):
+            raise ValueError('Invalid cursor')
+        limit = int(request.args.get('limit', LEARNED_WORDS_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
+    
+    catalog = catalog_store.current()
+    
+    if request.args.get('format') == 'ndjson':
+        def generate(after):
+            cursor = get_db().cursor()
+            while True:
+                rows = fetch_learned_words(cursor, user_id, after, LEARNED_WORDS_STREAM_CHUNK)
+                for word in learned_word_dicts(catalog, rows, lang):
+                    yield json.dumps(word, ensure_ascii=False) + '\n'
+                if len(rows) < LEARNED_WORDS_STREAM_CHUNK:
+                    break
+                after = (rows[-1]['learned_at'], rows[-1]['word_id'])
+        
+        return Response(stream_with_context(generate(after)),
+                        mimetype='application/x-ndjson'), 200
+    
+    cursor = get_db().cursor()
+    
+    if token is None and 'limit' not in request.args:
+        rows = fetch_learned_words(cursor, user_id, None, -1)
+        return jsonify(learned_word_dicts(catalog, rows, lang)), 200
+    
+    limit = max(1, min(limit, LEARNED_WORDS_MAX_LIMIT))
+    rows = fetch_learned_words(cursor, user_id, after, limit)
+    
+    next_token = None
+    if len(rows) == limit:
+        next_token = encode_cursor([rows[-1]['learned_at'], rows[-1]['word_id']])
+    
+    return jsonify({
+        'words': learned_word_dicts(catalog, rows, lang),
+        'next': next_token
+    }), 200
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+@app.route('/api/words/search', methods=['GET'])
+def search_words():
+    """Full-text word search ranked by bm25
+
+    `lang` (kk, en or ru) restricts matching to one language; Kazakh
+    matches both the Cyrillic word, with or without Kazakh-specific
+    letters, and its Latin transliteration.
+    """
+    query = request.args.get('q', '')
+    lang = request.args.get('lang')
+    
+    if lang is not None and lang not in search.LANGUAGE_COLUMNS:
+        return jsonify({'error': 'lang must be one of kk, en, ru'}), 400
+    try:
+        limit = int(request.args.get('limit', SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    
+    match = search.build_match(query, lang)
+    if match is None:
+        return jsonify([]), 200
+    
     conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
-    SELECT w.*, ulw.learned_at, ulw.proficiency
-    FROM words w
-    JOIN user_learned_words ulw ON w.id = ulw.word_id
-    WHERE ulw.user_id = ?
-    ORDER BY ulw.learned_at DESC
-    ''', (session['user_id'],))
+    SELECT rowid, rank FROM words_fts WHERE words_fts MATCH ? ORDER BY rank LIMIT ?
+    ''', (match, limit))
     
-    words = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    catalog = catalog_store.current()
+    words = []
+    
+    for row in cursor.fetchall():
+        word = catalog.words.get(row['rowid'])
+        if word is None:
+            continue
+        word = catalog.words.as_dict(word)
+        word['score'] = -row['rank']
+        words.append(word)
     
     return jsonify(words), 200
 
+# ============= REVIEW ENDPOINTS =============
+
+REVIEW_DEFAULT_LIMIT = 20
+REVIEW_MAX_LIMIT = 100
+REVIEW_MAX_GRADES = 200
+
+@app.route('/api/review/next', methods=['GET'])
+def get_review_cards():
+    """Get the learned words that are due for review, most overdue first"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        limit = int(request.args.get('limit', REVIEW_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, REVIEW_MAX_LIMIT))
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    # Range scan on idx_user_learned_words_due (user_id, due_at)
+    cursor.execute('''
+    SELECT word_id, ease, interval_days, repetitions, due_at FROM user_learned_words
+    WHERE user_id = ? AND due_at <= ?
+    ORDER BY due_at
+    LIMIT ?
+    ''', (session['user_id'], srs.utc_timestamp(), limit))
+    
+    catalog = catalog_store.current()
+    cards = []
+    
+    for row in cursor.fetchall():
+        word = catalog.words.get(row['word_id'])
+        if word is None:
+            continue
+        card = catalog.words.as_dict(word)
+        card.update(dict(row))
+        cards.append(card)
+    
+    return jsonify({'cards': cards}), 200
+
+def apply_review_grades(cursor, user_id, graded):
+    """Reschedule cards from {word_id: [grade, ...]} and return their new
+    state; ids left in `graded` are words the user has not learned"""
+    cursor.execute('''
+    SELECT word_id, ease, interval_days, repetitions FROM user_learned_words
+    WHERE user_id = ? AND word_id IN (SELECT value FROM json_each(?))
+    ''', (user_id, json.dumps(list(graded))))
+    
+    now = datetime.utcnow()
+    updates = []
+    results = []
+    
+    for row in cursor.fetchall():
+        state = dict(row)
+        # Several grades for one card in a batch apply in order
+        for grade in graded.pop(row['word_id']):
+            state.update(srs.schedule(state, grade, now))
+        updates.append((state['ease'], state['interval_days'], state['repetitions'],
+                        state['repetitions'], state['due_at'],
+                        user_id, row['word_id']))
+        results.append(state)
+    
+    cursor.executemany('''
+    UPDATE user_learned_words
+    SET ease = ?, interval_days = ?, repetitions = ?, proficiency = ?, due_at = ?
+    WHERE user_id = ? AND word_id = ?
+    ''', updates)
+    return results
+
+@app.route('/api/review/grade', methods=['POST'])
+def grade_reviews():
+    """Record review grades (0-5) and reschedule the cards
+
+    Accepts {"word_id": 1, "grade": 4} or {"grades": [{"word_id": 1, "grade": 4}, ...]}.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.json or {}
+    grades = data.get('grades', [data] if 'word_id' in data else None)
+    
+    if not isinstance(grades, list) or not grades:
+        return jsonify({'error': 'Grades required'}), 400
+    if len(grades) > REVIEW_MAX_GRADES:
+        return jsonify({'error': 'At most %d grades per request' % REVIEW_MAX_GRADES}), 400
+    
+    graded = {}
+    for item in grades:
+        try:
+            word_id = int(item['word_id'])
+            grade = int(item['grade'])
+        except (TypeError, KeyError, ValueError):
+            return jsonify({'error': 'Invalid grade entry: %r' % (item,)}), 400
+        if not 0 <= grade <= 5:
+            return jsonify({'error': 'Grade must be between 0 and 5'}), 400
+        graded.setdefault(word_id, []).append(grade)
+    
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    results = apply_review_grades(cursor, session['user_id'], graded)
+    
+    conn.commit()
+    
+    return jsonify({
+        'message': 'Reviews recorded',
+        'cards': results,
+        'unknown_word_ids': list(graded)
+    }), 200
+
 # ============= GRAMMAR ENDPOINTS =============
 
 @app.route('/api/grammar', methods=['GET'])
+@cached_catalog_response()
 def get_grammar_rules():
     """Get all grammar rules"""
     difficulty = request.args.get('difficulty')
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    conn = get_db()
-    cursor = conn.cursor()
+    catalog = catalog_store.current()
+    rules = catalog.grammar_rules.dicts(catalog.grammar_order, lang)
     
     if difficulty:
-        cursor.execute('''
-        SELECT * FROM grammar_rules WHERE difficulty = ? ORDER BY order_index
-        ''', (difficulty,))
-    else:
-        cursor.execute('SELECT * FROM grammar_rules ORDER BY order_index')
-    
-    rules = [dict(row) for row in cursor.fetchall()]
-    
-    # Parse examples JSON
-    for rule in rules:
-        if rule['examples']:
-            rule['examples'] = json.loads(rule['examples'])
+        rules = [rule for rule in rules if rule['difficulty'] == difficulty]
     
-    conn.close()
     return jsonify(rules), 200
 
 @app.route('/api/grammar/<int:rule_id>', methods=['GET'])
+@cached_catalog_response()
 def get_grammar_rule(rule_id):
     """Get specific grammar rule"""
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    cursor.execute('SELECT * FROM grammar_rules WHERE id = ?', (rule_id,))
-    rule = cursor.fetchone()
+    catalog = catalog_store.current()
+    rule = catalog.grammar_rules.get(rule_id)
     
     if not rule:
-        conn.close()
         return jsonify({'error': 'Grammar rule not found'}), 404
     
-    rule = dict(rule)
-    if rule['examples']:
-        rule['examples'] = json.loads(rule['examples'])
-    
-    conn.close()
-    return jsonify(rule), 200
+    return jsonify(catalog.grammar_rules.as_dict(rule, lang)), 200
 
 # ============= TEST ENDPOINTS =============
 
+TEST_MAX_QUESTIONS = 200
+
+# Issued question ids travel to the client and back in a signed token, so
+# any worker can grade a submission without server-side test state. The
+# token's test id is stored with the result, so each test is graded once.
+test_tokens = URLSafeTimedSerializer(app.secret_key, salt='course-test')
+
 @app.route('/api/courses/<int:course_id>/test', methods=['GET'])
 def get_course_test(course_id):
-    """Get test questions for a course"""
-    conn = get_db()
-    cursor = conn.cursor()
+    """Get a random sample of a course's test questions.
     
-    cursor.execute('''
-    SELECT * FROM course_tests WHERE course_id = ?
-    ''', (course_id,))
+    ?n= sets the number of questions; ?seed= makes the sample repeatable
+    for the current user.
+    """
+    try:
+        n = int(request.args.get('n', app.config['TEST_QUESTIONS']))
+    except ValueError:
+        return jsonify({'error': 'Invalid n'}), 400
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
+
+    n = max(1, min(n, TEST_MAX_QUESTIONS))
+    seed = request.args.get('seed')
+    user_id = session.get('user_id')
+    if seed is not None:
+        seed = '%s:%s:%s' % (user_id, course_id, seed)
+    
+    catalog = catalog_store.current()
+    if catalog.courses.get(course_id) is None:
+        return jsonify({'error': 'Course not found'}), 404
     
-    questions = [dict(row) for row in cursor.fetchall()]
+    question_ids = test_sampler.sample(catalog, course_id, n, seed)
+    tests = catalog.course_tests
+    questions = tests.dicts([tests.index[question_id] for question_id in question_ids], lang)
     
-    # Parse options JSON
+    # Don't send correct answer to client
     for question in questions:
-        if question['options']:
-            question['options'] = json.loads(question['options'])
-        # Don't send correct answer to client
         question.pop('correct_answer', None)
     
-    conn.close()
-    return jsonify(questions), 200
+    token = test_tokens.dumps([course_id, user_id, secrets.token_urlsafe(9), n, question_ids])
+    return jsonify({'token': token, 'questions': questions}), 200
+
+def issued_questions(token, course_id, user_id):
+    """(test id, question ids) of a test token; raises ValueError if the
+    token is invalid, expired or was issued for another course or user"""
+    try:
+        token_course, token_user, test_id, _, question_ids = test_tokens.loads(
+            str(token or ''), max_age=app.config['TEST_TOKEN_MAX_AGE'])
+    except (BadSignature, TypeError, ValueError):
+        raise ValueError('Invalid or expired test token')
+    if token_course != course_id or token_user != user_id:
+        raise ValueError('Test token does not match this course or user')
+    return test_id, question_ids
+
+def record_test_result(cursor, user_id, course_id, test_id, question_ids, answers):
+    """Grade and store a test attempt, updating course completion and
+    trophies; returns the result as sent to the client, or None if this
+    test was already submitted"""
+    # Grade the issued questions against the course's compiled answer key
+    # (cached per catalog version) instead of re-reading course_tests
+    answer_key = grading_engine.answer_key(catalog_store.current(), course_id)
+    questions = [answer_key[qid] for qid in question_ids if qid in answer_key]
+    score, total_points, results = grading_engine.grade(questions, answers)
+    
+    percentage = (score / total_points * 100) if total_points > 0 else 0
+    
+    # Only a test of standard length (or the whole question bank, if
+    # smaller) counts towards course completion and perfect tests
+    full_test = len(question_ids) >= min(app.config['TEST_QUESTIONS'], len(answer_key))
+    
+    # Save test result
+    cursor.execute('''
+    INSERT OR IGNORE INTO user_test_results
+        (user_id, course_id, test_id, score, total_points, percentage)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, course_id, test_id, score, total_points, percentage))
+    if not cursor.rowcount:
+        return None
+    
+    trophies = []
+    
+    # If score is 100%, count it towards the perfect_tests trophies
+    if percentage == 100 and full_test:
+        trophies += trophy_engine.increment(cursor, user_id, 'perfect_tests')
+    
+    # If test passed (>70%), mark course as completed. The first pass
+    # creates the user_course_completion row and bumps the counter;
+    # retakes only raise best_percentage.
+    if percentage >= 70 and full_test:
+        cursor.execute('''
+        INSERT OR IGNORE INTO user_course_completion
+            (user_id, course_id, first_passed_at, best_percentage)
+        VALUES (?, ?, CURRENT_TIMESTAMP, ?)
+        ''', (user_id, course_id, percentage))
+        
+        if cursor.rowcount:
+            trophies += trophy_engine.increment(cursor, user_id, 'courses_completed')
+        else:
+            cursor.execute('''
+            UPDATE user_course_completion SET best_percentage = MAX(best_percentage, ?)
+            WHERE user_id = ? AND course_id = ?
+            ''', (percentage, user_id, course_id))
+    
+    return {
+        'score': score,
+        'total_points': total_points,
+        'percentage': round(percentage, 2),
+        'passed': percentage >= 70 and full_test,
+        'full_test': full_test,
+        'results': results,
+        'trophies_awarded': trophies
+    }
 
 @app.route('/api/courses/<int:course_id>/test/submit', methods=['POST'])
 def submit_test(course_id):
@@ -465,101 +1235,407 @@ def submit_test(course_id):
     data = request.json
     answers = data.get('answers', {})  # {question_id: user_answer}
     
+    try:
+        test_id, question_ids = issued_questions(data.get('token'), course_id,
+                                                 session['user_id'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db()
     cursor = conn.cursor()
     
-    # Get all test questions
-    cursor.execute('''
-    SELECT id, correct_answer, points FROM course_tests WHERE course_id = ?
-    ''', (course_id,))
+    result = record_test_result(cursor, session['user_id'], course_id, test_id,
+                                question_ids, answers)
+    if result is None:
+        return jsonify({'error': 'Test already submitted'}), 400
     
-    questions = cursor.fetchall()
+    conn.commit()
     
-    score = 0
-    total_points = 0
-    results = []
+    return jsonify(result), 200
+
+# ============= GAME ENDPOINTS =============
+
+LEVELS = ('beginner', 'intermediate', 'advanced')
+
+# A game counts towards the games_won trophies with at least this many
+# answers and this share of them correct
+GAME_WIN_MIN_ANSWERED = 10
+GAME_WIN_ACCURACY = 0.8
+
+# Rounds carry their answers so the client can score instantly, so a result
+# is only as honest as its pacing: a game lasts 60 seconds and shows the
+# next question 1.2 seconds after an answer. Results from tokens younger
+# than GAME_MIN_SECONDS, or with more answers than the time allows, are
+# rejected, and at most GAME_WINS_PER_DAY wins a day count as won.
+GAME_MIN_SECONDS = 55
+GAME_MIN_SECONDS_PER_ANSWER = 1.0
+GAME_WINS_PER_DAY = 5
+
+# Issued rounds travel to the client and back in a signed token, like course
+# tests, so results are graded against what the server asked. The game id
+# lets each batch be recorded once.
+game_tokens = URLSafeTimedSerializer(app.secret_key, salt='name-game')
+
+@app.route('/api/game/rounds', methods=['GET'])
+def get_game_rounds():
+    """A batch of name game questions, optionally from one lesson or level"""
+    try:
+        n = int(request.args.get('n', DEFAULT_ROUNDS))
+        lesson_id = request.args.get('lesson')
+        lesson_id = int(lesson_id) if lesson_id is not None else None
+    except ValueError:
+        return jsonify({'error': 'Invalid n or lesson'}), 400
+    n = max(1, min(n, MAX_ROUNDS))
+    level = request.args.get('level')
+    if level is not None and level not in LEVELS:
+        return jsonify({'error': 'Invalid level'}), 400
+    
+    catalog_store.current()
+    rounds = round_generator.rounds(n, lesson_id, level)
+    token = game_tokens.dumps([session.get('user_id'), secrets.token_urlsafe(9),
+                               [r['word_id'] for r in rounds]])
+    return jsonify({'token': token, 'rounds': rounds}), 200
+
+def issued_rounds(token, user_id):
+    """(game id, word ids, seconds since issue) of a game token; raises
+    ValueError if the token is invalid, expired or was issued to another user"""
+    try:
+        (token_user, game_id, word_ids), issued_at = game_tokens.loads(
+            str(token or ''), max_age=app.config['GAME_TOKEN_MAX_AGE'],
+            return_timestamp=True)
+    except (BadSignature, TypeError, ValueError):
+        raise ValueError('Invalid or expired game token')
+    if token_user != user_id:
+        raise ValueError('Game token does not match this user')
+    return game_id, word_ids, time.time() - issued_at.timestamp()
+
+@app.route('/api/game/result', methods=['POST'])
+def submit_game_result():
+    """Record a finished game: {"token", "answers": [[word_id, answer], ...],
+    "score"}. Correct answers and the best streak are counted here from the
+    rounds issued with the token; only the displayed score is the client's."""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    for question in questions:
-        q_id = str(question['id'])
-        correct_answer = question['correct_answer']
-        points = question['points']
-        total_points += points
-        
-        user_answer = answers.get(q_id, '').strip().lower()
-        is_correct = user_answer == correct_answer.strip().lower()
-        
-        if is_correct:
-            score += points
-        
-        results.append({
-            'question_id': question['id'],
-            'correct': is_correct,
-            'correct_answer': correct_answer
-        })
+    data = request.json or {}
+    answers = data.get('answers')
+    try:
+        game_id, word_ids, age = issued_rounds(data.get('token'), session['user_id'])
+        correct, best_streak = grade_game(catalog_store.current(), word_ids, answers)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if age < GAME_MIN_SECONDS or len(answers) > age / GAME_MIN_SECONDS_PER_ANSWER:
+        return jsonify({'error': 'Game result does not match the time played'}), 400
+    try:
+        score = int(data.get('score', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'score must be an integer'}), 400
+    if score < 0:
+        return jsonify({'error': 'Invalid game result'}), 400
     
-    percentage = (score / total_points * 100) if total_points > 0 else 0
+    answered = len(answers)
+    won = answered >= GAME_WIN_MIN_ANSWERED and correct >= GAME_WIN_ACCURACY * answered
     
-    # Save test result
-    cursor.execute('''
-    INSERT INTO user_test_results (user_id, course_id, score, total_points, percentage)
-    VALUES (?, ?, ?, ?, ?)
-    ''', (session['user_id'], course_id, score, total_points, percentage))
+    conn = get_db()
+    cursor = conn.cursor()
     
-    # If score is 100%, check for trophy
-    if percentage == 100:
+    if won:
         cursor.execute('''
-        INSERT OR IGNORE INTO user_trophies (user_id, trophy_id)
-        SELECT ?, id FROM trophies WHERE requirement_type = 'perfect_tests'
+        SELECT COUNT(*) FROM user_game_results
+        WHERE user_id = ? AND played_at >= date('now') AND won
         ''', (session['user_id'],))
+        won = cursor.fetchone()[0] < GAME_WINS_PER_DAY
     
-    # If test passed (>70%), mark course as completed
-    if percentage >= 70:
-        cursor.execute('''
-        UPDATE users SET total_courses_completed = total_courses_completed + 1
-        WHERE id = ? AND id NOT IN (
-            SELECT user_id FROM user_test_results 
-            WHERE course_id = ? AND percentage >= 70 AND user_id = ?
-            GROUP BY user_id
-            HAVING COUNT(*) > 1
-        )
-        ''', (session['user_id'], course_id, session['user_id']))
+    cursor.execute('''
+    INSERT OR IGNORE INTO user_game_results
+        (user_id, game_id, score, correct, answered, best_streak, won)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (session['user_id'], game_id, score, correct, answered, best_streak, won))
+    if not cursor.rowcount:
+        return jsonify({'error': 'Game already recorded'}), 400
+    
+    trophies = []
+    if won:
+        trophies = trophy_engine.increment(cursor, session['user_id'], 'games_won')
     
     conn.commit()
-    conn.close()
     
     return jsonify({
-        'score': score,
-        'total_points': total_points,
-        'percentage': round(percentage, 2),
-        'passed': percentage >= 70,
-        'results': results
+        'correct': correct,
+        'answered': answered,
+        'best_streak': best_streak,
+        'won': won,
+        'trophies_awarded': trophies
     }), 200
 
 # ============= TROPHIES ENDPOINTS =============
 
 @app.route('/api/trophies', methods=['GET'])
+@cached_catalog_response(per_user=True)
 def get_trophies():
     """Get all trophies"""
-    conn = get_db()
-    cursor = conn.cursor()
+    try:
+        lang = request_language()
+    except ValueError:
+        return jsonify({'error': LANGUAGE_ERROR}), 400
     
-    cursor.execute('SELECT * FROM trophies')
-    trophies = [dict(row) for row in cursor.fetchall()]
+    catalog = catalog_store.current()
+    trophies = catalog.trophies.dicts(lang=lang)
     
     # If user logged in, mark which they've earned
     if 'user_id' in session:
+        conn = get_db()
+        cursor = conn.cursor()
+        
         cursor.execute('''
         SELECT trophy_id FROM user_trophies WHERE user_id = ?
         ''', (session['user_id'],))
         
-        earned_ids = [row['trophy_id'] for row in cursor.fetchall()]
+        earned_ids = {row['trophy_id'] for row in cursor.fetchall()}
         
         for trophy in trophies:
             trophy['earned'] = trophy['id'] in earned_ids
     
-    conn.close()
     return jsonify(trophies), 200
 
+# ============= LEADERBOARD ENDPOINTS =============
+
+LEADERBOARD_DEFAULT_LIMIT = 10
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_MAX_NEIGHBOURS = 10
+
+def leaderboard_name(args):
+    """Board name for ?metric= / ?course_id=, or None if invalid"""
+    if args.get('course_id') is not None:
+        try:
+            return 'course:%d' % int(args['course_id'])
+        except ValueError:
+            return None
+    metric = args.get('metric', 'words')
+    return metric if metric in GLOBAL_BOARDS else None
+
+def leaderboard_entries(entries):
+    """Attach usernames to (user_id, score, rank) tuples"""
+    if not entries:
+        return []
+    cursor = get_db().cursor()
+    cursor.execute('''
+    SELECT id, username FROM users WHERE id IN (SELECT value FROM json_each(?))
+    ''', (json.dumps([user_id for user_id, _, _ in entries]),))
+    usernames = {row['id']: row['username'] for row in cursor.fetchall()}
+    return [{
+        'rank': rank,
+        'user_id': user_id,
+        'username': usernames.get(user_id),
+        'score': score
+    } for user_id, score, rank in entries]
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    """Top users by ?metric= (words, courses, trophies, weekly_xp), or by
+    lessons completed in a course with ?course_id="""
+    name = leaderboard_name(request.args)
+    if name is None:
+        return jsonify({'error': 'Invalid metric'}), 400
+    try:
+        limit = int(request.args.get('limit', LEADERBOARD_DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, LEADERBOARD_MAX_LIMIT))
+    
+    board = leaderboards.board(name)
+    entries = board.slice(0, limit) if board else []
+    
+    return jsonify({
+        'board': name,
+        'total': board.total if board else 0,
+        'entries': leaderboard_entries(entries)
+    }), 200
+
+@app.route('/api/leaderboard/me', methods=['GET'])
+def get_my_leaderboard_position():
+    """The current user's rank on a board plus the users around them"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    name = leaderboard_name(request.args)
+    if name is None:
+        return jsonify({'error': 'Invalid metric'}), 400
+    try:
+        neighbours = int(request.args.get('neighbours', 2))
+    except ValueError:
+        return jsonify({'error': 'Invalid neighbours'}), 400
+    neighbours = max(0, min(neighbours, LEADERBOARD_MAX_NEIGHBOURS))
+    
+    board = leaderboards.board(name)
+    position = board.position(session['user_id']) if board else None
+    if position is None:
+        return jsonify({'board': name, 'rank': None, 'score': None,
+                        'total': board.total if board else 0, 'entries': []}), 200
+    
+    return jsonify({
+        'board': name,
+        'rank': board.rank(session['user_id']),
+        'score': board.scores[session['user_id']],
+        'total': board.total,
+        'entries': leaderboard_entries(
+            board.slice(position - neighbours, position + neighbours + 1))
+    }), 200
+
+# ============= SYNC ENDPOINTS =============
+
+SYNC_MAX_EVENTS = 500
+SYNC_MAX_EVENT_ID = 64
+
+# Per-user change log behind POST /api/sync; see sync.py
+sync_log = sync.SyncLog(retention_days=app.config['SYNC_RETENTION_DAYS'])
+
+def parse_sync_event(event, user_id):
+    """(event id, type, arguments) for one client event; raises ValueError
+    describing the problem if the event cannot be applied"""
+    if not isinstance(event, dict):
+        raise ValueError('Event must be an object')
+    event_id = event.get('id')
+    if not isinstance(event_id, (str, int)) or not 0 < len(str(event_id)) <= SYNC_MAX_EVENT_ID:
+        raise ValueError('Event id must be a string of at most %d characters'
+                         % SYNC_MAX_EVENT_ID)
+    kind = event.get('type')
+    try:
+        if kind == 'lesson_completed':
+            args = (int(event['lesson_id']),)
+        elif kind == 'word_learned':
+            args = (int(event['word_id']), int(event.get('proficiency', 1)))
+            if args[0] not in catalog_store.current().words.index:
+                raise ValueError('Word not found')
+        elif kind == 'review':
+            args = (int(event['word_id']), int(event['grade']))
+            if not 0 <= args[1] <= 5:
+                raise ValueError('Grade must be between 0 and 5')
+        elif kind == 'test_submitted':
+            course_id = int(event['course_id'])
+            answers = event.get('answers') or {}
+            if not isinstance(answers, dict):
+                raise ValueError('answers must be an object')
+            args = ((course_id,) + issued_questions(event.get('token'), course_id, user_id)
+                    + (answers,))
+        else:
+            raise ValueError('Unknown event type: %r' % (kind,))
+    except (KeyError, TypeError):
+        raise ValueError('Missing or invalid fields for %s' % kind)
+    return str(event_id), kind, args
+
+def apply_sync_event(cursor, user_id, kind, args):
+    """Apply one parsed event; returns (error or None, extra result fields)"""
+    if kind == 'lesson_completed':
+        if not record_lesson_completion(cursor, user_id, *args):
+            return 'Lesson not found', {}
+    elif kind == 'word_learned':
+        cursor.execute(LEARN_WORD_SQL, (user_id,) + args)
+    elif kind == 'review':
+        word_id, grade = args
+        if not apply_review_grades(cursor, user_id, {word_id: [grade]}):
+            return 'Word not learned', {}
+    elif kind == 'test_submitted':
+        result = record_test_result(cursor, user_id, *args)
+        if result is None:
+            return 'Test already submitted', {}
+        return None, {'result': result}
+    return None, {}
+
+@app.route('/api/sync', methods=['POST'])
+def sync_state():
+    """Apply a batch of offline events and return what changed since `token`
+    
+    Accepts {"token": "<from the last sync>", "events": [{"id": ..., "type":
+    ...}, ...]} with types lesson_completed, word_learned, review and
+    test_submitted. Events are applied in order in one transaction; an id
+    already applied is skipped, so a client can resend a batch after a lost
+    response. The reply holds every row changed after `token` (including
+    the effects of these events) and a new token; without a token, or with
+    one older than the log retention, it is a full snapshot instead.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.json or {}
+    events = data.get('events') or []
+    
+    if not isinstance(events, list):
+        return jsonify({'error': 'events must be a list'}), 400
+    if len(events) > SYNC_MAX_EVENTS:
+        return jsonify({'error': 'At most %d events per sync' % SYNC_MAX_EVENTS}), 400
+    try:
+        since = sync.decode_token(data['token']) if data.get('token') is not None else None
+    except ValueError:
+        return jsonify({'error': 'Invalid sync token'}), 400
+    
+    user_id = session['user_id']
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    applied = []
+    trophies = []
+    if events:
+        before = learned_word_total(cursor, user_id)
+        for event in events:
+            try:
+                event_id, kind, args = parse_sync_event(event, user_id)
+            except ValueError as e:
+                applied.append({'id': event.get('id') if isinstance(event, dict) else None,
+                                'status': 'rejected', 'error': str(e)})
+                continue
+            cursor.execute('''
+            INSERT OR IGNORE INTO user_sync_events (user_id, event_id) VALUES (?, ?)
+            ''', (user_id, event_id))
+            if not cursor.rowcount:
+                applied.append({'id': event_id, 'status': 'duplicate'})
+                continue
+            error, extra = apply_sync_event(cursor, user_id, kind, args)
+            if error:
+                # Not applied, so a corrected resend must not count as a duplicate
+                cursor.execute('''
+                DELETE FROM user_sync_events WHERE user_id = ? AND event_id = ?
+                ''', (user_id, event_id))
+                applied.append({'id': event_id, 'status': 'rejected', 'error': error})
+                continue
+            trophies += extra.get('result', {}).get('trophies_awarded', [])
+            applied.append(dict(extra, id=event_id, status='applied'))
+        trophies += trophy_engine.evaluate(cursor, user_id, 'words_learned',
+                                           before, learned_word_total(cursor, user_id))
+    
+    horizon, newest = sync_log.bounds(cursor)
+    full = since is None or not horizon <= since <= newest
+    if full:
+        token, changed = newest, dict.fromkeys(sync.ENTITIES)
+    else:
+        token, changed = sync_log.changes(cursor, user_id, since)
+    
+    changes = {}
+    deleted = {}
+    for entity, ids in changed.items():
+        changes[entity], removed = sync_log.rows(cursor, user_id, entity, ids)
+        if removed:
+            deleted[entity] = removed
+    
+    cursor.execute('''
+    SELECT total_words_learned, total_courses_completed, total_trophies, streak_days
+    FROM users WHERE id = ?
+    ''', (user_id,))
+    user = dict(cursor.fetchone())
+    
+    conn.commit()
+    sync_log.prune(conn)
+    
+    return jsonify({
+        'token': sync.encode_token(token),
+        'full': full,
+        'events': applied,
+        'changes': changes,
+        'deleted': deleted,
+        'user': user,
+        'trophies_awarded': trophies
+    }), 200
+
 # ============= UTILITY ENDPOINTS =============
 
 @app.route('/api/check-session', methods=['GET'])
@@ -0,0 +1,462 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import SYNTHETIC_PASSWORD, SYNTHETIC_USERNAME, generate_dataset
+
+
+# Per scale factor unit
+USERS_PER_SCALE = 1000
+
+# Session types and their share of the mix
+SESSION_MIX = (
+    ('learner', 6),
+    ('browser', 3),
+    ('reviewer', 1),
+    ('player', 1),
+    ('newcomer', 1),
+)
+
+# Word search queries: English, Kazakh with and without the Kazakh-specific
+# letters, Latin transliteration and a prefix
+SEARCH_QUERIES = ('hello', 'сәлем', 'салем', 'salem', 'water', 'su', 'кітап', 'fam')
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'benchmark_baseline.json')
+
+# Endpoints with fewer samples than this, or moving by less than
+# MIN_REGRESSION_MS, are too noisy to fail a comparison
+MIN_COMPARE_SAMPLES = 20
+MIN_REGRESSION_MS = 0.5
+
+
+# ============= SYNTHETIC DATABASE =============
+
+def username_for(n):
+    # On a fresh database synthetic user ids start right after the sample user
+    return SYNTHETIC_USERNAME % (n + 2)
+
+def build_database(path, scale=1.0, seed=1):
+    """Fresh database with sample content plus database.generate_dataset()'s
+    synthetic content and scale * USERS_PER_SCALE users"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    users = int(scale * USERS_PER_SCALE)
+    generate_dataset(path, users, seed, progress=lambda message: None)
+    return users
+
+
+# ============= CLIENTS =============
+
+class TestClient:
+    """Drives the app in-process through Flask's test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        try:
+            data = response.get_json(silent=True)
+        finally:
+            response.close()
+        return response.status_code, data
+
+
+class HttpClient:
+    """Drives a running server (e.g. gunicorn) over HTTP with its own cookies"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload)
+        except ValueError:
+            return status, None
+
+
+# ============= SESSIONS =============
+
+class Recorder:
+    """Collects (label, seconds, ok) samples from all worker threads"""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def call(self, client, method, label, path, body=None, expect=()):
+        """Time one request; statuses >= 400 not listed in `expect` are errors"""
+        started = time.perf_counter()
+        status, data = client.request(method, path, body)
+        elapsed = time.perf_counter() - started
+        key = '%s %s' % (method, label)
+        with self._lock:
+            self.samples.setdefault(key, []).append(elapsed)
+            if status >= 400 and status not in expect:
+                self.errors[key] = self.errors.get(key, 0) + 1
+        return status, data
+
+def browser_session(client, rec, rng, plan):
+    """Anonymous visitor reading the catalog"""
+    status, courses = rec.call(client, 'GET', '/api/courses', '/api/courses')
+    course_ids = [c['id'] for c in courses or ()] or [1]
+    for _ in range(rng.randint(1, 3)):
+        course_id = rng.choice(course_ids)
+        status, course = rec.call(client, 'GET', '/api/courses/<id>', '/api/courses/%d' % course_id)
+        lessons = (course or {}).get('lessons') or []
+        if lessons:
+            lesson = rng.choice(lessons)
+            rec.call(client, 'GET', '/api/lessons/<id>', '/api/lessons/%d' % lesson['id'])
+    rec.call(client, 'GET', '/api/courses/<id>/bundle',
+             '/api/courses/%d/bundle' % rng.choice(course_ids))
+    for _ in range(rng.randint(1, 3)):
+        rec.call(client, 'GET', '/api/words/search',
+                 '/api/words/search?q=%s' % urllib.parse.quote(rng.choice(SEARCH_QUERIES)))
+    status, grammar = rec.call(client, 'GET', '/api/grammar', '/api/grammar')
+    if grammar:
+        rec.call(client, 'GET', '/api/grammar/<id>',
+                 '/api/grammar/%d' % rng.choice(grammar)['id'])
+    rec.call(client, 'GET', '/api/trophies', '/api/trophies')
+
+def login(client, rec, plan):
+    rec.call(client, 'POST', '/api/login', '/api/login',
+             {'username': username_for(plan['user']), 'password': SYNTHETIC_PASSWORD})
+
+def learner_session(client, rec, rng, plan):
+    """login -> courses -> course (page by page, or as one bundle the way
+    app.js opens it) -> learn words -> test -> submit"""
+    login(client, rec, plan)
+    status, courses = rec.call(client, 'GET', '/api/courses', '/api/courses')
+    course_id = rng.choice([c['id'] for c in courses or ()] or [1])
+    if rng.random() < 0.5:
+        status, bundle = rec.call(client, 'GET', '/api/courses/<id>/bundle',
+                                  '/api/courses/%d/bundle' % course_id)
+        lessons = (bundle or {}).get('lessons') or []
+        for lesson in rng.sample(lessons, min(len(lessons), rng.randint(1, 3))):
+            words = lesson.get('words') or []
+            if words:
+                rec.call(client, 'POST', '/api/words/learn/batch', '/api/words/learn/batch',
+                         {'words': [w['id'] for w in words[:rng.randint(1, 10)]]})
+            rec.call(client, 'POST', '/api/lessons/<id>/complete',
+                     '/api/lessons/%d/complete' % lesson['id'])
+    else:
+        status, course = rec.call(client, 'GET', '/api/courses/<id>',
+                                  '/api/courses/%d' % course_id)
+        lessons = (course or {}).get('lessons') or []
+        for lesson in rng.sample(lessons, min(len(lessons), rng.randint(1, 3))):
+            status, lesson = rec.call(client, 'GET', '/api/lessons/<id>',
+                                      '/api/lessons/%d' % lesson['id'])
+            for word in ((lesson or {}).get('words') or [])[:rng.randint(1, 5)]:
+                rec.call(client, 'POST', '/api/words/learn', '/api/words/learn',
+                         {'word_id': word['id'], 'proficiency': rng.randint(1, 5)})
+            rec.call(client, 'POST', '/api/lessons/<id>/complete',
+                     '/api/lessons/%d/complete' % lesson['id'])
+    rec.call(client, 'GET', '/api/user/stats', '/api/user/stats')
+    status, test = rec.call(client, 'GET', '/api/courses/<id>/test',
+                            '/api/courses/%d/test' % course_id)
+    test = test or {}
+    answers = {}
+    for question in test.get('questions') or ():
+        options = question.get('options') or ['?']
+        answers[str(question['id'])] = rng.choice(options)
+    rec.call(client, 'POST', '/api/courses/<id>/test/submit',
+             '/api/courses/%d/test/submit' % course_id,
+             {'answers': answers, 'token': test.get('token')})
+    rec.call(client, 'GET', '/api/leaderboard', '/api/leaderboard?metric=weekly_xp')
+    rec.call(client, 'GET', '/api/leaderboard/me', '/api/leaderboard/me?metric=weekly_xp')
+    rec.call(client, 'POST', '/api/logout', '/api/logout')
+
+def reviewer_session(client, rec, rng, plan):
+    """login -> due cards -> grade them -> learned word list"""
+    login(client, rec, plan)
+    status, data = rec.call(client, 'GET', '/api/review/next', '/api/review/next?limit=20')
+    cards = (data or {}).get('cards') or []
+    if cards:
+        rec.call(client, 'POST', '/api/review/grade', '/api/review/grade',
+                 {'grades': [{'word_id': c['word_id'], 'grade': rng.randint(0, 5)}
+                             for c in cards]})
+    rec.call(client, 'GET', '/api/words/learned', '/api/words/learned?limit=50')
+    rec.call(client, 'GET', '/api/user/profile', '/api/user/profile')
+    rec.call(client, 'POST', '/api/logout', '/api/logout')
+
+def player_session(client, rec, rng, plan):
+    """login -> name game -> offline sync -> profile update"""
+    login(client, rec, plan)
+    status, game = rec.call(client, 'GET', '/api/game/rounds', '/api/game/rounds?n=60')
+    rounds = (game or {}).get('rounds') or []
+    answers = [[r['word_id'], rng.choice(r['options'])] for r in rounds[:rng.randint(10, 40)]]
+    # A result posted right after the rounds were issued is rejected as too
+    # fast; the request still exercises token checks and grading
+    rec.call(client, 'POST', '/api/game/result', '/api/game/result',
+             {'token': (game or {}).get('token'), 'answers': answers, 'score': 0},
+             expect=(400,))
+    status, synced = rec.call(client, 'POST', '/api/sync', '/api/sync', {'events': []})
+    events = [{'id': uuid.uuid4().hex, 'type': 'word_learned', 'word_id': r['word_id']}
+              for r in rounds[:rng.randint(1, 5)]]
+    rec.call(client, 'POST', '/api/sync', '/api/sync',
+             {'token': (synced or {}).get('token'), 'events': events})
+    rec.call(client, 'PUT', '/api/user/update', '/api/user/update',
+             {'current_theme': rng.choice(('purple', 'dark'))})
+    rec.call(client, 'POST', '/api/logout', '/api/logout')
+
+def newcomer_session(client, rec, rng, plan):
+    """register -> courses -> first course bundle -> learn a few words"""
+    name = 'bench_%s' % uuid.uuid4().hex[:12]
+    rec.call(client, 'POST', '/api/register', '/api/register',
+             {'username': name, 'email': name + '@example.com',
+              'password': SYNTHETIC_PASSWORD})
+    status, courses = rec.call(client, 'GET', '/api/courses', '/api/courses')
+    course_id = ([c['id'] for c in courses or ()] or [1])[0]
+    status, bundle = rec.call(client, 'GET', '/api/courses/<id>/bundle',
+                              '/api/courses/%d/bundle' % course_id)
+    lessons = (bundle or {}).get('lessons') or []
+    if lessons and lessons[0].get('words'):
+        rec.call(client, 'POST', '/api/words/learn/batch', '/api/words/learn/batch',
+                 {'words': [w['id'] for w in lessons[0]['words'][:rng.randint(1, 5)]]})
+    rec.call(client, 'GET', '/api/user/profile', '/api/user/profile')
+    rec.call(client, 'POST', '/api/logout', '/api/logout')
+
+SESSIONS = {
+    'learner': learner_session,
+    'browser': browser_session,
+    'reviewer': reviewer_session,
+    'player': player_session,
+    'newcomer': newcomer_session,
+}
+
+def plan_sessions(count, users, seed):
+    """Deterministic list of sessions: type, user and a per-session seed"""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in SESSION_MIX]
+    weights = [weight for _, weight in SESSION_MIX]
+    return [{
+        'kind': rng.choices(kinds, weights)[0],
+        'user': rng.randrange(users),
+        'seed': rng.getrandbits(32),
+    } for _ in range(count)]
+
+def run_sessions(make_client, plans, concurrency, rec):
+    def worker(plan):
+        SESSIONS[plan['kind']](make_client(), rec, random.Random(plan['seed']), plan)
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for plan in plans:
+            worker(plan)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker, plan) for plan in plans]:
+                future.result()
+    return time.perf_counter() - started
+
+
+# ============= RESULTS =============
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+def summarize(rec, elapsed, meta):
+    endpoints = {}
+    total = 0
+    errors = 0
+    for key, samples in sorted(rec.samples.items()):
+        samples = sorted(samples)
+        total += len(samples)
+        errors += rec.errors.get(key, 0)
+        endpoints[key] = {
+            'count': len(samples),
+            'errors': rec.errors.get(key, 0),
+            'mean_ms': round(sum(samples) / len(samples) * 1000, 3),
+            'p50_ms': round(percentile(samples, 50) * 1000, 3),
+            'p95_ms': round(percentile(samples, 95) * 1000, 3),
+            'p99_ms': round(percentile(samples, 99) * 1000, 3),
+        }
+    return {
+        'meta': meta,
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'errors': errors,
+        'throughput_rps': round(total / elapsed, 1) if elapsed else 0.0,
+        'endpoints': endpoints,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_report(result):
+    print("%-40s %7s %6s %9s %9s %9s" % ('endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for key, stats in result['endpoints'].items():
+        print("%-40s %7d %6d %9.2f %9.2f %9.2f" % (
+            key, stats['count'], stats['errors'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms']))
+    print("\n%d requests in %.1fs: %.1f req/s, %d errors" % (
+        result['requests'], result['elapsed_s'], result['throughput_rps'], result['errors']))
+
+def compare(baseline, result, threshold, metric='p95_ms'):
+    """Regressions of `metric` beyond threshold (a fraction), plus throughput.
+
+    Returns a list of human-readable problems; empty means no regression.
+    """
+    problems = []
+    for key, stats in result['endpoints'].items():
+        base = baseline['endpoints'].get(key)
+        if base is None or min(base['count'], stats['count']) < MIN_COMPARE_SAMPLES:
+            continue
+        old, new = base[metric], stats[metric]
+        if new > old * (1 + threshold) and new - old >= MIN_REGRESSION_MS:
+            problems.append("%s %s %.2f -> %.2f ms (+%.0f%%)" % (
+                key, metric, old, new, (new / old - 1) * 100 if old else float('inf')))
+    old_rps, new_rps = baseline['throughput_rps'], result['throughput_rps']
+    if old_rps and new_rps < old_rps * (1 - threshold):
+        problems.append("throughput %.1f -> %.1f req/s (%.0f%%)" % (
+            old_rps, new_rps, (new_rps / old_rps - 1) * 100))
+    return problems
+
+
+# ============= CLI =============
+
+def run(args):
+    users = int(args.scale * USERS_PER_SCALE)
+    if args.target:
+        # The server must already be running against a database built with
+        # `python benchmark.py build` at the same --scale and --seed
+        make_client = lambda: HttpClient(args.target)
+    else:
+        database = args.database or os.path.join(tempfile.mkdtemp(prefix='kazakh-bench-'),
+                                                 'bench.db')
+        if args.rebuild or not os.path.exists(database):
+            print("Building synthetic database (scale %s) at %s..." % (args.scale, database))
+            build_database(database, args.scale, args.seed)
+        os.environ['KAZAKH_DATABASE'] = database
+        from app import app
+        make_client = lambda: TestClient(app)
+
+    if args.warmup:
+        run_sessions(make_client, plan_sessions(args.warmup, users, args.seed + 1),
+                     args.concurrency, Recorder())
+
+    rec = Recorder()
+    plans = plan_sessions(args.sessions, users, args.seed)
+    elapsed = run_sessions(make_client, plans, args.concurrency, rec)
+
+    result = summarize(rec, elapsed, {
+        'scale': args.scale,
+        'seed': args.seed,
+        'sessions': args.sessions,
+        'concurrency': args.concurrency,
+        'target': args.target or 'test-client',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(result, f, indent=2)
+        print("✅ Saved baseline to %s" % args.baseline)
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            return report_comparison(json.load(f), result, args.threshold, args.metric)
+    return 0
+
+def report_comparison(baseline, result, threshold, metric):
+    for field in ('target', 'scale', 'concurrency'):
+        if baseline['meta'].get(field) != result['meta'].get(field):
+            print("⚠️  Baseline %s %r differs from this run's %r" % (
+                field, baseline['meta'].get(field), result['meta'].get(field)))
+    problems = compare(baseline, result, threshold, metric)
+    for problem in problems:
+        print("❌ %s" % problem)
+    if problems:
+        return 1
+    print("✅ No regressions beyond %.0f%% against baseline %s" % (
+        threshold * 100, baseline['meta'].get('revision')))
+    return 0
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Kazakh Learning API benchmark')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build a synthetic database')
+    build.add_argument('database')
+    build.add_argument('--scale', type=float, default=1.0)
+    build.add_argument('--seed', type=int, default=1)
+
+    bench = commands.add_parser('run', help='run session mixes and report latencies')
+    bench.add_argument('--scale', type=float, default=1.0,
+                       help='%d users per unit' % USERS_PER_SCALE)
+    bench.add_argument('--seed', type=int, default=1)
+    bench.add_argument('--sessions', type=int, default=300)
+    bench.add_argument('--warmup', type=int, default=30)
+    bench.add_argument('--concurrency', type=int, default=1)
+    bench.add_argument('--database', help='reuse (or build) this database file')
+    bench.add_argument('--rebuild', action='store_true')
+    bench.add_argument('--target', help='base URL of a running server, e.g. http://127.0.0.1:8000')
+    bench.add_argument('--output', help='write JSON results here')
+    bench.add_argument('--baseline', default=DEFAULT_BASELINE)
+    bench.add_argument('--save-baseline', action='store_true')
+    bench.add_argument('--threshold', type=float, default=0.15)
+    bench.add_argument('--metric', default='p95_ms', choices=('p50_ms', 'p95_ms', 'p99_ms'))
+
+    diff = commands.add_parser('compare', help='compare two result files')
+    diff.add_argument('baseline')
+    diff.add_argument('result')
+    diff.add_argument('--threshold', type=float, default=0.15)
+    diff.add_argument('--metric', default='p95_ms', choices=('p50_ms', 'p95_ms', 'p99_ms'))
+
+    args = parser.parse_args(argv[1:])
+    if args.command == 'build':
+        users = build_database(args.database, args.scale, args.seed)
+        print("✅ Built %s with %d users (password %r)" % (args.database, users, SYNTHETIC_PASSWORD))
+        return 0
+    if args.command == 'run':
+        return run(args)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.result) as f:
+        result = json.load(f)
+    return report_comparison(baseline, result, args.threshold, args.metric)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
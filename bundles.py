@@ -0,0 +1,229 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+
+from catalog import LANGUAGES, load_catalog
+
+
+# Variants built per course: every language (None) plus one per ?lang=
+BUNDLE_LANGUAGES = (None,) + LANGUAGES
+
+# A catalog version's bundle files are kept this long after the next
+# version is published, so a worker still serving the old version keeps its
+# files until it reloads
+STALE_SECONDS = 60 * 60
+
+# Per-version list of bundles, written when a version's bundles are built
+MANIFEST = 'manifest-%d.json'
+_MANIFEST_NAME = re.compile(r'^manifest-(\d+)\.json$')
+
+
+class Bundle:
+    """One prebuilt course bundle on disk, plain and gzipped"""
+
+    __slots__ = ('course_id', 'lang', 'version', 'etag', 'path', 'gzip_path', 'size',
+                 'gzip_size')
+
+    def __init__(self, course_id, lang, version, etag, path, gzip_path, size, gzip_size):
+        self.course_id = course_id
+        self.lang = lang
+        self.version = version
+        self.etag = etag
+        self.path = path
+        self.gzip_path = gzip_path
+        self.size = size
+        self.gzip_size = gzip_size
+
+
+def course_bundle(catalog, course_id, lang=None):
+    """The course, its lessons with their words and the grammar rules of the
+    course's level, as one dict"""
+    courses = catalog.courses
+    course = courses.as_dict(courses.get(course_id), lang)
+    lessons = catalog.lessons.dicts(catalog.lessons_by_course.get(course_id, ()), lang)
+    words_by_lesson = catalog.words_by_lesson
+    for lesson in lessons:
+        lesson['words'] = catalog.words.dicts(words_by_lesson.get(lesson['id'], ()), lang)
+    rules = catalog.grammar_rules
+    difficulty_pos = rules.col('difficulty')
+    grammar = rules.dicts([i for i in catalog.grammar_order
+                           if rules.rows[i][difficulty_pos] == course['level']], lang)
+    return {'course': course, 'lessons': lessons, 'grammar': grammar}
+
+
+def encode_bundle(content, version):
+    """Serialized bundle and its ETag.
+
+    The "hash" field covers the content only, so clients can tell a course
+    did not change across catalog versions. The ETag is the hash of the
+    exact bytes served, version and hash included, as a strong ETag must be.
+    """
+    body = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    content_hash = hashlib.sha256(body).hexdigest()[:20]
+    header = '{"version":%d,"hash":"%s",' % (version, content_hash)
+    data = header.encode('utf-8') + body[1:]
+    return data, hashlib.sha256(data).hexdigest()[:20]
+
+
+def write_file(path, data):
+    """Write atomically, so concurrent readers never see a partial file"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class BundleStore:
+    """Course bundles prebuilt into files when the catalog is published.
+
+    The publishing command (`database.py setup/import/generate`, or
+    `python bundles.py`) builds every bundle and a manifest for the catalog
+    version. Servers reloading the catalog only read that manifest, and
+    build the bundles themselves only if it is missing or belongs to other
+    content. Files are named by the hash of their bytes, so concurrent
+    builds write identical files and a file that already exists is not
+    compressed again. Requests only look up a Bundle and hand its path to
+    send_file(), which gunicorn serves with sendfile().
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.bundles = {}
+        self.builds = 0
+
+    def load(self, catalog):
+        """Use the bundles published for the catalog, building them if
+        there are none; registered as a catalog reload callback"""
+        bundles = self.read_manifest(catalog)
+        if bundles is None:
+            return self.build(catalog)
+        self.bundles = bundles
+        return self
+
+    def _bundle(self, catalog, course_id, lang, etag, size, gzip_size):
+        path = os.path.join(self.root, etag + '.json')
+        return Bundle(course_id, lang, catalog.version, etag, path, path + '.gz', size,
+                      gzip_size)
+
+    def read_manifest(self, catalog):
+        """Bundles listed in the catalog version's manifest, or None if
+        there is no manifest for this content or a file is missing"""
+        try:
+            with open(os.path.join(self.root, MANIFEST % catalog.version),
+                      encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('published_at') != catalog.published_at:
+            return None
+        bundles = {}
+        for course_id, lang, etag, size, gzip_size in manifest['bundles']:
+            bundle = self._bundle(catalog, course_id, lang, etag, size, gzip_size)
+            if not os.path.exists(bundle.gzip_path):
+                return None
+            bundles[(course_id, lang)] = bundle
+        return bundles
+
+    def build(self, catalog):
+        """Build every course bundle and the version's manifest"""
+        os.makedirs(self.root, exist_ok=True)
+        bundles = {}
+        for course_id in catalog.courses.index:
+            for lang in BUNDLE_LANGUAGES:
+                body, etag = encode_bundle(course_bundle(catalog, course_id, lang),
+                                           catalog.version)
+                path = os.path.join(self.root, etag + '.json')
+                gzip_path = path + '.gz'
+                if not os.path.exists(gzip_path):
+                    write_file(path, body)
+                    write_file(gzip_path, gzip.compress(body, compresslevel=9, mtime=0))
+                bundles[(course_id, lang)] = self._bundle(
+                    catalog, course_id, lang, etag, os.path.getsize(path),
+                    os.path.getsize(gzip_path))
+        manifest = {
+            'version': catalog.version,
+            'published_at': catalog.published_at,
+            'bundles': [[b.course_id, b.lang, b.etag, b.size, b.gzip_size]
+                        for b in bundles.values()],
+        }
+        write_file(os.path.join(self.root, MANIFEST % catalog.version),
+                   json.dumps(manifest).encode('utf-8'))
+        self.bundles = bundles
+        self.builds += 1
+        self.prune()
+        return self
+
+    def prune(self, max_age=STALE_SECONDS):
+        """Remove the files of versions superseded more than `max_age` ago.
+
+        A manifest is superseded when the next one (by write time) appears,
+        so the newest manifest and any replaced less than `max_age` ago keep
+        their files. Files no kept manifest lists are removed once they are
+        `max_age` old; younger ones may belong to a build still running.
+        """
+        now = time.time()
+        manifests = []
+        for name in os.listdir(self.root):
+            if _MANIFEST_NAME.match(name):
+                try:
+                    manifests.append((os.path.getmtime(os.path.join(self.root, name)), name))
+                except FileNotFoundError:
+                    continue
+        manifests.sort()
+        keep = set(os.path.basename(path) for bundle in self.bundles.values()
+                   for path in (bundle.path, bundle.gzip_path))
+        for i, (_, name) in enumerate(manifests):
+            path = os.path.join(self.root, name)
+            superseded_at = manifests[i + 1][0] if i + 1 < len(manifests) else None
+            try:
+                if superseded_at is not None and superseded_at < now - max_age:
+                    os.unlink(path)
+                    continue
+                with open(path, encoding='utf-8') as f:
+                    entries = json.load(f)['bundles']
+            except (OSError, ValueError, KeyError):
+                continue
+            keep.add(name)
+            for entry in entries:
+                keep.add(entry[2] + '.json')
+                keep.add(entry[2] + '.json.gz')
+        cutoff = now - max_age
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if name not in keep and os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+            except FileNotFoundError:
+                continue
+
+    def get(self, course_id, lang=None):
+        return self.bundles.get((course_id, lang))
+
+
+def main(argv):
+    database = argv[1] if len(argv) > 1 else 'kazakh_learning.db'
+    root = argv[2] if len(argv) > 2 else 'bundles'
+    conn = sqlite3.connect(database, isolation_level=None)
+    started = time.perf_counter()
+    store = BundleStore(root).build(load_catalog(conn))
+    conn.close()
+    for (course_id, lang), bundle in sorted(store.bundles.items(),
+                                            key=lambda item: (item[0][0], item[0][1] or '')):
+        print("course %-4d %-3s %s  %7d bytes  %6d gzipped" % (
+            course_id, lang or '*', bundle.etag, bundle.size, bundle.gzip_size))
+    print("%d bundle(s) in %s (%.0f ms)" % (len(store.bundles), root,
+                                            (time.perf_counter() - started) * 1000))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
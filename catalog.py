@@ -0,0 +1,217 @@
+import json
+import operator
+import os
+import sqlite3
+import threading
+import time
+
+
+# Suffixes of the per-language text columns (title_en, title_kk, title_ru...)
+LANGUAGES = ('en', 'kk', 'ru')
+
+
+class Table:
+    """Immutable rows of one catalog table.
+
+    Rows are plain tuples sharing a single `columns` tuple, which keeps the
+    snapshot compact (no per-row dicts) and lets forked gunicorn workers
+    share the pages copy-on-write. `index` maps primary key -> row position.
+
+    as_dict() and dicts() take an optional `lang`, which projects every
+    `<name>_en/_kk/_ru` column group down to a single `<name>` field in that
+    language and leaves the other columns as they are.
+    """
+
+    __slots__ = ('columns', 'rows', 'index', '_pos', '_projections')
+
+    def __init__(self, columns, rows):
+        self.columns = tuple(columns)
+        self.rows = tuple(rows)
+        self._pos = {name: i for i, name in enumerate(self.columns)}
+        id_pos = self._pos['id']
+        self.index = {row[id_pos]: i for i, row in enumerate(self.rows)}
+        self._projections = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def col(self, name):
+        """Position of a column inside each row tuple"""
+        return self._pos[name]
+
+    def get(self, row_id):
+        """Row tuple for a primary key, or None"""
+        i = self.index.get(row_id)
+        return None if i is None else self.rows[i]
+
+    def projection(self, lang):
+        """(columns, getter) for one language; getter(row) returns the
+        projected values as a tuple"""
+        projection = self._projections.get(lang)
+        if projection is None:
+            columns = []
+            positions = []
+            for i, name in enumerate(self.columns):
+                base, _, suffix = name.rpartition('_')
+                if suffix not in LANGUAGES:
+                    columns.append(name)
+                    positions.append(i)
+                elif suffix == lang:
+                    columns.append(base)
+                    positions.append(i)
+            projection = (tuple(columns), operator.itemgetter(*positions))
+            self._projections[lang] = projection
+        return projection
+
+    def as_dict(self, row, lang=None):
+        if lang is None:
+            return dict(zip(self.columns, row))
+        columns, getter = self.projection(lang)
+        return dict(zip(columns, getter(row)))
+
+    def dicts(self, positions=None, lang=None):
+        """Rows (all, or the given positions) as fresh dicts"""
+        rows = self.rows if positions is None else [self.rows[i] for i in positions]
+        if lang is None:
+            columns = self.columns
+            return [dict(zip(columns, row)) for row in rows]
+        columns, getter = self.projection(lang)
+        return [dict(zip(columns, getter(row))) for row in rows]
+
+
+def _group(table, key, order=None):
+    """Map key column value -> tuple of row positions, optionally sorted"""
+    key_pos = table.col(key)
+    groups = {}
+    for i, row in enumerate(table.rows):
+        groups.setdefault(row[key_pos], []).append(i)
+    if order is not None:
+        order_pos = table.col(order)
+        for positions in groups.values():
+            positions.sort(key=lambda i: (table.rows[i][order_pos] is None,
+                                          table.rows[i][order_pos] or 0))
+    return {k: tuple(v) for k, v in groups.items()}
+
+
+def _ordered(table, order):
+    order_pos = table.col(order)
+    return tuple(sorted(range(len(table.rows)),
+                        key=lambda i: (table.rows[i][order_pos] is None,
+                                       table.rows[i][order_pos] or 0)))
+
+
+def _parse_json_column(columns, rows, name):
+    """Decode a JSON text column once at load time"""
+    pos = columns.index(name)
+    parsed = []
+    for row in rows:
+        if row[pos]:
+            row = row[:pos] + (json.loads(row[pos]),) + row[pos + 1:]
+        parsed.append(row)
+    return parsed
+
+
+class Catalog:
+    """Snapshot of the read-mostly course content at one catalog version"""
+
+    __slots__ = ('version', 'published_at', 'courses', 'lessons', 'words', 'grammar_rules',
+                 'trophies', 'course_tests', 'course_order', 'grammar_order',
+                 'lessons_by_course', 'words_by_lesson', 'tests_by_course')
+
+    TABLES = ('courses', 'lessons', 'words', 'grammar_rules', 'trophies',
+              'course_tests')
+    JSON_COLUMNS = {'grammar_rules': 'examples', 'course_tests': 'options'}
+
+    def __init__(self, version, tables, published_at=None):
+        self.version = version
+        self.published_at = published_at
+        for name in self.TABLES:
+            setattr(self, name, tables[name])
+        self.course_order = _ordered(self.courses, 'order_index')
+        self.grammar_order = _ordered(self.grammar_rules, 'order_index')
+        self.lessons_by_course = _group(self.lessons, 'course_id', 'lesson_order')
+        self.words_by_lesson = _group(self.words, 'lesson_id')
+        self.tests_by_course = _group(self.course_tests, 'course_id')
+
+
+def read_catalog_version(conn):
+    return conn.execute('SELECT version FROM catalog_meta WHERE id = 1').fetchone()[0]
+
+
+def load_catalog(conn):
+    """Read every catalog table inside one read transaction"""
+    conn.execute('BEGIN')
+    try:
+        version, published_at = conn.execute(
+            'SELECT version, updated_at FROM catalog_meta WHERE id = 1').fetchone()
+        tables = {}
+        for name in Catalog.TABLES:
+            cursor = conn.execute('SELECT * FROM %s ORDER BY id' % name)
+            columns = [d[0] for d in cursor.description]
+            rows = [tuple(row) for row in cursor.fetchall()]
+            if name in Catalog.JSON_COLUMNS:
+                rows = _parse_json_column(columns, rows, Catalog.JSON_COLUMNS[name])
+            tables[name] = Table(columns, rows)
+    finally:
+        conn.rollback()
+    return Catalog(version, tables, published_at)
+
+
+class CatalogStore:
+    """Holds the current Catalog and swaps in a new one when the version moves.
+
+    The version counter is polled at most once every `check_interval`
+    seconds on a private connection, so ordinary requests never touch the
+    database to read catalog content. Replacement is a single reference
+    assignment: readers see either the old snapshot or the new one.
+    """
+
+    def __init__(self, database, check_interval=1.0):
+        self.database = database
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.catalog = None
+        self._listeners = []
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.database, check_same_thread=False,
+                                         isolation_level=None)
+            self._pid = os.getpid()
+        return self._conn
+
+    def on_reload(self, callback):
+        """Register callback(catalog) to run after each snapshot swap"""
+        self._listeners.append(callback)
+        return callback
+
+    def load(self):
+        """Load a fresh snapshot unconditionally"""
+        with self._lock:
+            catalog = load_catalog(self._connection())
+            self.catalog = catalog
+            self._checked_at = time.monotonic()
+            self.reloads += 1
+        for callback in self._listeners:
+            callback(catalog)
+        return catalog
+
+    def current(self):
+        """Return the current snapshot, reloading it if the version changed"""
+        catalog = self.catalog
+        if catalog is None:
+            return self.load()
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return catalog
+        with self._lock:
+            if time.monotonic() - self._checked_at < self.check_interval:
+                return self.catalog
+            self._checked_at = time.monotonic()
+            version = read_catalog_version(self._connection())
+        if version != catalog.version:
+            return self.load()
+        return catalog
@@ -1,11 +1,34 @@
 import sqlite3
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import hashlib
+import ast
+import csv
+import os
+import random
+import re
+import sys
+import time
 
-def create_database():
+from bundles import BundleStore
+from catalog import load_catalog
+from leaderboard import XP_PER_LESSON, XP_PER_WORD
+from search import RANK_WEIGHTS, fold_sql
+from sync import ENTITIES as SYNC_ENTITIES
+
+DATABASE = 'kazakh_learning.db'
+APP_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+def create_database(path=DATABASE):
     """Create the database and all necessary tables"""
-    conn = sqlite3.connect('kazakh_learning.db')
+    conn = sqlite3.connect(path)
+    create_schema(conn)
+    migrate(conn)
+    print("✅ Database schema created successfully!")
+    return conn
+
+def create_schema(conn):
+    """Create the base tables (schema version 0)"""
     cursor = conn.cursor()
     
     # Users table
@@ -184,8 +207,406 @@ def create_database():
     ''')
     
     conn.commit()
-    print("✅ Database schema created successfully!")
-    return conn
+
+# ============= MIGRATIONS =============
+
+# Each migration is (version, description, steps). A step is either an SQL
+# string or a callable taking the connection. Migrations run in order, each
+# in its own transaction, and are recorded in schema_version so they apply
+# exactly once to an existing database.
+MIGRATIONS = [
+    (1, 'Secondary indexes for hot lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_courses_order ON courses(order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_lessons_course_order ON lessons(course_id, lesson_order)',
+        'CREATE INDEX IF NOT EXISTS idx_words_lesson ON words(lesson_id)',
+        'CREATE INDEX IF NOT EXISTS idx_grammar_order ON grammar_rules(order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_grammar_difficulty_order ON grammar_rules(difficulty, order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_course_tests_course ON course_tests(course_id)',
+        'CREATE INDEX IF NOT EXISTS idx_user_progress_course '
+        'ON user_progress(user_id, course_id, completed)',
+        'CREATE INDEX IF NOT EXISTS idx_user_test_results_course '
+        'ON user_test_results(user_id, course_id, percentage)',
+        'CREATE INDEX IF NOT EXISTS idx_user_learned_words_learned '
+        'ON user_learned_words(user_id, learned_at, word_id, proficiency)',
+        'CREATE INDEX IF NOT EXISTS idx_user_trophies_earned ON user_trophies(user_id, earned_at)',
+    ]),
+    (2, 'Catalog version counter', [
+        '''CREATE TABLE IF NOT EXISTS catalog_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        'INSERT OR IGNORE INTO catalog_meta (id, version) VALUES (1, 1)',
+    ]),
+    (3, 'Trigger-maintained user counters', [
+        '''CREATE TRIGGER IF NOT EXISTS trg_learned_words_insert
+        AFTER INSERT ON user_learned_words BEGIN
+            UPDATE users SET total_words_learned = total_words_learned + 1
+            WHERE id = NEW.user_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_learned_words_delete
+        AFTER DELETE ON user_learned_words BEGIN
+            UPDATE users SET total_words_learned = total_words_learned - 1
+            WHERE id = OLD.user_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_user_trophies_insert
+        AFTER INSERT ON user_trophies BEGIN
+            UPDATE users SET total_trophies = total_trophies + 1
+            WHERE id = NEW.user_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_user_trophies_delete
+        AFTER DELETE ON user_trophies BEGIN
+            UPDATE users SET total_trophies = total_trophies - 1
+            WHERE id = OLD.user_id;
+        END''',
+        # Start the counters from the true totals
+        '''UPDATE users SET
+            total_words_learned = (SELECT COUNT(*) FROM user_learned_words
+                                   WHERE user_id = users.id),
+            total_trophies = (SELECT COUNT(*) FROM user_trophies
+                              WHERE user_id = users.id)''',
+    ]),
+    (4, 'Counters for game and perfect-test trophies', [
+        'ALTER TABLE users ADD COLUMN total_games_won INTEGER DEFAULT 0',
+        'ALTER TABLE users ADD COLUMN total_perfect_tests INTEGER DEFAULT 0',
+        '''UPDATE users SET total_perfect_tests = (
+            SELECT COUNT(*) FROM user_test_results
+            WHERE user_id = users.id AND percentage = 100)''',
+    ]),
+    (5, 'Spaced-repetition scheduling columns', [
+        'ALTER TABLE user_learned_words ADD COLUMN ease REAL DEFAULT 2.5',
+        'ALTER TABLE user_learned_words ADD COLUMN interval_days REAL DEFAULT 0',
+        'ALTER TABLE user_learned_words ADD COLUMN repetitions INTEGER DEFAULT 0',
+        'ALTER TABLE user_learned_words ADD COLUMN due_at TIMESTAMP',
+        # Words learned before scheduling existed are due straight away
+        'UPDATE user_learned_words SET due_at = COALESCE(learned_at, CURRENT_TIMESTAMP)',
+        'CREATE INDEX IF NOT EXISTS idx_user_learned_words_due '
+        'ON user_learned_words(user_id, due_at)',
+    ]),
+    (6, 'Full-text word search', [lambda conn: create_word_search(conn)]),
+    (7, 'Materialized course completion', [
+        '''CREATE TABLE IF NOT EXISTS user_course_completion (
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            first_passed_at TIMESTAMP NOT NULL,
+            best_percentage REAL NOT NULL,
+            PRIMARY KEY (user_id, course_id),
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
+        ) WITHOUT ROWID''',
+        # Backfill from the test history, then derive the counter from it
+        '''INSERT OR IGNORE INTO user_course_completion
+            (user_id, course_id, first_passed_at, best_percentage)
+        SELECT user_id, course_id, MIN(completed_at), MAX(percentage)
+        FROM user_test_results
+        WHERE percentage >= 70
+        GROUP BY user_id, course_id''',
+        '''UPDATE users SET total_courses_completed = (
+            SELECT COUNT(*) FROM user_course_completion WHERE user_id = users.id)''',
+    ]),
+    (8, 'Leaderboard change log', [lambda conn: create_leaderboard_log(conn)]),
+    (9, 'Name game results', [
+        '''CREATE TABLE IF NOT EXISTS user_game_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            correct INTEGER NOT NULL,
+            answered INTEGER NOT NULL,
+            best_streak INTEGER NOT NULL DEFAULT 0,
+            won BOOLEAN NOT NULL DEFAULT 0,
+            played_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_user_game_results_user '
+        'ON user_game_results(user_id, played_at)',
+    ]),
+    (10, 'Per-user sync log', [lambda conn: create_sync_log(conn)]),
+    (11, 'Name game ids', [
+        # Each issued batch of rounds can be recorded once
+        'ALTER TABLE user_game_results ADD COLUMN game_id TEXT',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_user_game_results_game '
+        'ON user_game_results(user_id, game_id)',
+    ]),
+    (12, 'Course test ids', [
+        # Each issued test can be submitted once
+        'ALTER TABLE user_test_results ADD COLUMN test_id TEXT',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_user_test_results_test '
+        'ON user_test_results(user_id, test_id)',
+    ]),
+]
+
+def word_search_values(row):
+    """SQL value list for a words_fts row built from `row` (NEW or words)"""
+    return '%s.id, %s, %s.english, %s.russian, %s.pronunciation, %s' % (
+        row, fold_sql('%s.kazakh' % row), row, row, row,
+        "%s || ' ' || COALESCE(%s.example_sentence_en, '') || ' ' || "
+        "COALESCE(%s.example_sentence_ru, '')" % (
+            fold_sql("COALESCE(%s.example_sentence_kk, '')" % row), row, row))
+
+def create_word_search(conn):
+    """FTS5 index over words, kept in sync by triggers"""
+    conn.execute('''
+    CREATE VIRTUAL TABLE IF NOT EXISTS words_fts USING fts5(
+        kazakh, english, russian, pronunciation, examples,
+        tokenize = "unicode61 remove_diacritics 2",
+        prefix = '2 3'
+    )
+    ''')
+    conn.execute("INSERT INTO words_fts (words_fts, rank) VALUES ('rank', 'bm25(%s)')"
+                 % ', '.join(str(w) for w in RANK_WEIGHTS))
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_words_fts_insert AFTER INSERT ON words BEGIN
+        INSERT INTO words_fts (rowid, kazakh, english, russian, pronunciation, examples)
+        VALUES (%s);
+    END
+    ''' % word_search_values('NEW'))
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_words_fts_delete AFTER DELETE ON words BEGIN
+        DELETE FROM words_fts WHERE rowid = OLD.id;
+    END
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_words_fts_update AFTER UPDATE ON words BEGIN
+        DELETE FROM words_fts WHERE rowid = OLD.id;
+        INSERT INTO words_fts (rowid, kazakh, english, russian, pronunciation, examples)
+        VALUES (%s);
+    END
+    ''' % word_search_values('NEW'))
+    conn.execute('DELETE FROM words_fts')
+    conn.execute('''
+    INSERT INTO words_fts (rowid, kazakh, english, russian, pronunciation, examples)
+    SELECT %s FROM words
+    ''' % word_search_values('words'))
+
+def weekly_xp_sql(user_id):
+    """SQL expression for a user's XP since Monday (UTC); see leaderboard.py"""
+    return '''(
+        (SELECT COUNT(*) FROM user_learned_words
+         WHERE user_id = {0} AND learned_at >= date('now', 'weekday 0', '-6 days')) * {1}
+      + (SELECT COUNT(*) FROM user_progress
+         WHERE user_id = {0} AND completed = 1
+           AND completed_at >= date('now', 'weekday 0', '-6 days')) * {2}
+    )'''.format(user_id, XP_PER_WORD, XP_PER_LESSON)
+
+def create_leaderboard_log(conn):
+    """Append-only log of score changes that every worker's leaderboards tail"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS leaderboard_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        board TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_changes_time
+    ON leaderboard_changes(changed_at)
+    ''')
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_lb_new_user AFTER INSERT ON users BEGIN
+        INSERT INTO leaderboard_changes (user_id, board, score) VALUES
+            (NEW.id, 'words', 0), (NEW.id, 'courses', 0),
+            (NEW.id, 'trophies', 0), (NEW.id, 'weekly_xp', 0);
+    END
+    ''')
+    for board, column in (('words', 'total_words_learned'),
+                          ('courses', 'total_courses_completed'),
+                          ('trophies', 'total_trophies')):
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_lb_{0} AFTER UPDATE OF {1} ON users
+        WHEN NEW.{1} IS NOT OLD.{1} BEGIN
+            INSERT INTO leaderboard_changes (user_id, board, score)
+            VALUES (NEW.id, '{0}', NEW.{1});
+        END
+        '''.format(board, column))
+    for event in ('INSERT', 'UPDATE OF learned_at'):
+        conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_lb_xp_word_{0} AFTER {1} ON user_learned_words BEGIN
+            INSERT INTO leaderboard_changes (user_id, board, score)
+            VALUES (NEW.user_id, 'weekly_xp', {2});
+        END
+        '''.format(event.split()[0].lower(), event, weekly_xp_sql('NEW.user_id')))
+    conn.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_lb_lesson AFTER INSERT ON user_progress
+    WHEN NEW.completed = 1 BEGIN
+        INSERT INTO leaderboard_changes (user_id, board, score)
+        VALUES (NEW.user_id, 'weekly_xp', {0}),
+               (NEW.user_id, 'course:' || NEW.course_id,
+                (SELECT COUNT(*) FROM user_progress
+                 WHERE user_id = NEW.user_id AND course_id = NEW.course_id AND completed = 1));
+    END
+    '''.format(weekly_xp_sql('NEW.user_id')))
+
+def create_sync_log(conn):
+    """Per-user change log that POST /api/sync reads deltas from, plus the
+    ids of client events already applied"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_user_sync_log_user
+    ON user_sync_log(user_id, seq, entity, entity_id)
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_user_sync_log_time ON user_sync_log(changed_at)
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS user_sync_events (
+        user_id INTEGER NOT NULL,
+        event_id TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, event_id)
+    ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_user_sync_events_time ON user_sync_events(applied_at)
+    ''')
+    for entity, (table, key, _) in SYNC_ENTITIES.items():
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_sync_{0}_{1} AFTER {2} ON {3} BEGIN
+                INSERT INTO user_sync_log (user_id, entity, entity_id)
+                VALUES ({4}.user_id, '{0}', {4}.{5});
+            END
+            '''.format(entity, event.lower(), event, table, row, key))
+
+def get_schema_version(conn):
+    """Return the highest applied migration version (0 for a fresh schema)"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def migrate(conn):
+    """Apply pending migrations in order and return the versions applied"""
+    get_schema_version(conn)
+    applied = []
+    
+    for version, description, steps in MIGRATIONS:
+        # BEGIN IMMEDIATE takes the write lock before checking the version,
+        # so concurrent workers starting up cannot apply a migration twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute(
+                'SELECT 1 FROM schema_version WHERE version = ?', (version,)
+            ).fetchone()
+            if done:
+                conn.rollback()
+                continue
+            
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    
+    return applied
+
+def bump_catalog_version(conn):
+    """Mark catalog content as changed so running servers reload their snapshot.
+
+    Call this in the same transaction as any write to courses, lessons,
+    words, grammar_rules, trophies or course_tests.
+    """
+    conn.execute('''
+    UPDATE catalog_meta SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    WHERE id = 1
+    ''')
+
+def ensure_schema(path=DATABASE):
+    """Create missing tables and apply pending migrations"""
+    conn = sqlite3.connect(path)
+    try:
+        create_schema(conn)
+        return migrate(conn)
+    finally:
+        conn.close()
+
+# ============= QUERY PLAN CHECK =============
+
+# Tables whose size grows with the number of users; a full scan of any of
+# them on a request path is a bug
+USER_SCOPED_TABLES = {
+    'users', 'user_progress', 'user_learned_words', 'user_test_results',
+    'user_trophies', 'user_course_completion', 'user_game_results', 'user_sync_log',
+    'user_sync_events',
+}
+
+def extract_queries(source_path=APP_SOURCE):
+    """Collect literal SQL strings passed to execute()/executemany() in a module"""
+    with open(source_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), source_path)
+    
+    # Module-level SQL constants, e.g. LEARN_WORD_SQL = '''...'''
+    constants = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign)
+                and len(node.targets) == 1
+                and isinstance(node.targets[0], ast.Name)
+                and isinstance(node.value, ast.Constant)
+                and isinstance(node.value.value, str)):
+            constants[node.targets[0].id] = node.value.value
+    
+    queries = []
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call)
+                and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany')
+                and node.args):
+            arg = node.args[0]
+            if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+                sql = arg.value
+            elif isinstance(arg, ast.Name) and arg.id in constants:
+                sql = constants[arg.id]
+            else:
+                continue
+            sql = sql.strip()
+            if not sql.upper().startswith(('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK')):
+                queries.append((node.lineno, sql))
+    return queries
+
+def check_query_plans(conn, source_path=APP_SOURCE):
+    """EXPLAIN every query in source_path and return those that scan a user-scoped table"""
+    scan = re.compile(r'\bSCAN (?:TABLE )?(\w+)')
+    problems = []
+    
+    for lineno, sql in extract_queries(source_path):
+        params = (None,) * sql.count('?')
+        try:
+            plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        except sqlite3.Error as e:
+            problems.append((lineno, sql, 'error: %s' % e))
+            continue
+        for row in plan:
+            detail = row[-1]
+            match = scan.search(detail)
+            if match and match.group(1) in USER_SCOPED_TABLES:
+                problems.append((lineno, sql, detail))
+    
+    return problems
 
 def populate_sample_data(conn):
     """Populate database with sample data"""
@@ -329,15 +750,523 @@ def populate_sample_data(conn):
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', question)
     
+    bump_catalog_version(conn)
     conn.commit()
     print("✅ Sample data populated successfully!")
 
-if __name__ == "__main__":
-    print("Creating Kazakh Learning Platform Database...")
-    conn = create_database()
-    populate_sample_data(conn)
+# ============= BULK IMPORT =============
+
+# Natural key and JSON-encoded columns for each importable catalog table.
+# Re-importing a file updates rows whose natural key already exists and
+# inserts the rest, so imports are idempotent.
+IMPORT_SPECS = {
+    'courses': {'key': ('title_en',), 'json': ()},
+    'lessons': {'key': ('course_id', 'lesson_order'), 'json': ()},
+    'words': {'key': ('lesson_id', 'kazakh'), 'json': ()},
+    'grammar_rules': {'key': ('title_en',), 'json': ('examples',)},
+    'course_tests': {'key': ('course_id', 'question_text_en'), 'json': ('options',)},
+    'trophies': {'key': ('name_en',), 'json': ()},
+}
+
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_COMMIT_EVERY = 100000
+
+def read_records(path):
+    """Stream dict records from a .csv or .jsonl/.ndjson file"""
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            for record in csv.DictReader(f):
+                # Empty CSV cells are NULLs
+                yield {k: (v if v != '' else None) for k, v in record.items()}
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+class ReferenceResolver:
+    """Turns `course` (title_en) and `course` + `lesson_order` references
+    in import records into course_id / lesson_id"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._courses = None
+        self._lessons = None
+
+    def course_id(self, title):
+        if self._courses is None:
+            self._courses = dict(self.conn.execute('SELECT title_en, id FROM courses'))
+        if title not in self._courses:
+            raise ValueError('Unknown course: %r' % title)
+        return self._courses[title]
+
+    def lesson_id(self, course_id, lesson_order):
+        if self._lessons is None:
+            self._lessons = {
+                (c, o): i for i, c, o in
+                self.conn.execute('SELECT id, course_id, lesson_order FROM lessons')
+            }
+        key = (int(course_id), int(lesson_order))
+        if key not in self._lessons:
+            raise ValueError('Unknown lesson %r of course %r' % (lesson_order, course_id))
+        return self._lessons[key]
+
+    def resolve(self, table, record):
+        record = dict(record)
+        course = record.pop('course', None)
+        if course is not None and table in ('lessons', 'words', 'course_tests'):
+            course_id = self.course_id(course)
+            if table == 'words':
+                record['lesson_id'] = self.lesson_id(course_id, record.pop('lesson_order'))
+            else:
+                record['course_id'] = course_id
+        return record
+
+def natural_key(spec, values):
+    return tuple(str(values[k]) if values[k] is not None else None for k in spec['key'])
+
+# Index and trigger definitions as stored in sqlite_master
+_CREATE_OBJECT = re.compile(r'^\s*CREATE\s+(?:UNIQUE\s+)?(?:INDEX|TRIGGER)\s+(?!IF\s+NOT\s+EXISTS\b)',
+                            re.IGNORECASE)
+
+def if_not_exists(sql):
+    """A CREATE [UNIQUE] INDEX or CREATE TRIGGER statement read back from
+    sqlite_master, with IF NOT EXISTS added so it can be replayed safely"""
+    return _CREATE_OBJECT.sub(lambda m: m.group(0) + 'IF NOT EXISTS ', sql, count=1)
+
+def import_content(conn, table, path, chunk_size=IMPORT_CHUNK_SIZE,
+                   commit_every=IMPORT_COMMIT_EVERY, progress=print):
+    """Stream a CSV/JSONL file into a catalog table as idempotent upserts.
+
+    Secondary indexes on the table are dropped for the load and rebuilt at
+    the end, rows are written with executemany in transactions of
+    `commit_every` rows, and the catalog version is bumped when done.
+    Every record must carry the same fields; missing fields are NULL.
+    Returns the number of rows inserted and updated.
+    """
+    if table not in IMPORT_SPECS:
+        raise ValueError('Cannot import into %r' % table)
+    spec = IMPORT_SPECS[table]
+    table_columns = [row[1] for row in conn.execute('PRAGMA table_info(%s)' % table)]
+    resolver = ReferenceResolver(conn)
+    
+    # Existing natural keys -> id
+    existing = {}
+    for row in conn.execute('SELECT id, %s FROM %s' % (', '.join(spec['key']), table)):
+        existing[natural_key(spec, dict(zip(('id',) + spec['key'], row)))] = row[0]
+    
+    # Relaxed durability for the load; the file can simply be re-imported
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    
+    deferred_indexes = conn.execute('''
+    SELECT name, sql FROM sqlite_master
+    WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL
+    ''', (table,)).fetchall()
+    
+    inserted = updated = since_commit = 0
+    started = time.perf_counter()
+    columns = None
+    
+    try:
+        for name, _ in deferred_indexes:
+            conn.execute('DROP INDEX IF EXISTS %s' % name)
+        conn.commit()
+        
+        for chunk in chunked(read_records(path), chunk_size):
+            # Last occurrence of a natural key within a chunk wins
+            inserts = {}
+            updates = []
+            for record in chunk:
+                record = resolver.resolve(table, record)
+                if columns is None:
+                    columns = [c for c in table_columns if c in record and c != 'id']
+                    missing = [k for k in spec['key'] if k not in columns]
+                    if missing:
+                        raise ValueError('Missing key fields for %s: %s' % (table, ', '.join(missing)))
+                    insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                        table, ', '.join(columns), ', '.join('?' * len(columns)))
+                    update_sql = 'UPDATE %s SET %s WHERE id = ?' % (
+                        table, ', '.join('%s = ?' % c for c in columns))
+                for c in spec['json']:
+                    if c in record and not isinstance(record[c], (str, type(None))):
+                        record[c] = json.dumps(record[c], ensure_ascii=False)
+                values = tuple(record.get(c) for c in columns)
+                key = natural_key(spec, record)
+                if key in existing:
+                    updates.append(values + (existing[key],))
+                else:
+                    inserts[key] = values
+            
+            if updates:
+                conn.executemany(update_sql, updates)
+            if inserts:
+                max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM %s' % table).fetchone()[0]
+                conn.executemany(insert_sql, list(inserts.values()))
+                # Learn the new ids so later chunks update instead of duplicating
+                cursor = conn.execute('SELECT id, %s FROM %s WHERE id > ?' % (
+                    ', '.join(spec['key']), table), (max_id,))
+                for row in cursor:
+                    existing[natural_key(spec, dict(zip(('id',) + spec['key'], row)))] = row[0]
+            
+            inserted += len(inserts)
+            updated += len(updates)
+            since_commit += len(chunk)
+            if since_commit >= commit_every:
+                conn.commit()
+                since_commit = 0
+            
+            elapsed = time.perf_counter() - started
+            progress('  %s: %d inserted, %d updated (%.0f rows/sec)' % (
+                table, inserted, updated, (inserted + updated) / elapsed if elapsed else 0))
+        
+        bump_catalog_version(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        progress('  rebuilding %d index(es) on %s' % (len(deferred_indexes), table))
+        for _, sql in deferred_indexes:
+            conn.execute(if_not_exists(sql))
+        conn.commit()
+        conn.execute('PRAGMA synchronous = NORMAL')
+    
+    return inserted, updated
+
+# ============= SYNTHETIC DATA =============
+
+# Synthetic users all share the sample account's password
+SYNTHETIC_PASSWORD = 'password123'
+SYNTHETIC_USERNAME = 'user%07d'
+
+# Generated catalog content per course, on top of the sample data
+SYNTHETIC_LESSONS_PER_COURSE = 20
+SYNTHETIC_WORDS_PER_LESSON = 25
+SYNTHETIC_QUESTIONS_PER_COURSE = 20
+
+# Pareto shape for per-user activity: most users learn a handful of words,
+# a long tail works through whole courses
+SYNTHETIC_ACTIVITY_ALPHA = 1.5
+SYNTHETIC_WORDS_PER_ACTIVITY = 8
+SYNTHETIC_HISTORY_DAYS = 365
+SYNTHETIC_STAMPS_PER_DAY = 4
+
+SYNTHETIC_CHUNK_USERS = 50000
+PASS_PERCENTAGE = 70
+
+# SM-2 interval (days) after n successful repetitions at the default ease
+INTERVALS = (0, 1, 6, 15, 37.5, 93.75)
+
+def generate_content(conn, rng):
+    """Add generated lessons, words and test questions to every course.
+
+    Returns the learning path: (course_id, [(lesson_id, [word_id, ...]), ...])
+    for each course in order.
+    """
+    path = []
+    courses = conn.execute('SELECT id FROM courses ORDER BY order_index, id').fetchall()
+    for (course_id,) in courses:
+        lessons = []
+        for n in range(1, SYNTHETIC_LESSONS_PER_COURSE + 1):
+            cursor = conn.execute('''
+            INSERT INTO lessons (course_id, title_en, title_kk, title_ru,
+                                 content_en, content_kk, content_ru, lesson_order)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (course_id, 'Lesson %d.%d' % (course_id, n), 'Сабақ %d.%d' % (course_id, n),
+                  'Урок %d.%d' % (course_id, n), 'Lesson text. ' * 50, 'Сабақ мәтіні. ' * 50,
+                  'Текст урока. ' * 50, 1000 + n))
+            lesson_id = cursor.lastrowid
+            word_ids = []
+            for w in range(SYNTHETIC_WORDS_PER_LESSON):
+                cursor = conn.execute('''
+                INSERT INTO words (lesson_id, kazakh, english, russian, pronunciation, word_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ''', (lesson_id, 'сөз %d-%d' % (lesson_id, w), 'word %d-%d' % (lesson_id, w),
+                      'слово %d-%d' % (lesson_id, w), 'soz %d-%d' % (lesson_id, w),
+                      rng.choice(('noun', 'verb', 'adjective'))))
+                word_ids.append(cursor.lastrowid)
+            lessons.append((lesson_id, word_ids))
+        for n in range(SYNTHETIC_QUESTIONS_PER_COURSE):
+            options = ['%d' % rng.randrange(1000) for _ in range(4)]
+            conn.execute('''
+            INSERT INTO course_tests (course_id, question_text_en, question_text_kk,
+                                      question_text_ru, question_type, correct_answer,
+                                      options, points)
+            VALUES (?, ?, ?, ?, 'multiple_choice', ?, ?, 1)
+            ''', (course_id, 'Question %d.%d' % (course_id, n), 'Сұрақ %d.%d' % (course_id, n),
+                  'Вопрос %d.%d' % (course_id, n), options[0], json.dumps(options)))
+        path.append((course_id, lessons))
+    bump_catalog_version(conn)
+    return path
+
+def synthetic_user_rows(rng, user_id, path, stamps):
+    """Rows for one user: (user, learned words, progress, test results).
+
+    Users start at a course (mostly the first) and work through its lessons
+    in order, so early words are far more popular than late ones. Learned
+    words carry SM-2 state; tests are retaken until passed or given up on.
+    `stamps` are timestamps, newest first.
+    """
+    activity = rng.paretovariate(SYNTHETIC_ACTIVITY_ALPHA)
+    n_words = int((activity - 1) * SYNTHETIC_WORDS_PER_ACTIVITY)
+    last = len(stamps) - 1
+    # Active over a window ending some time ago; heavier users for longer
+    end = rng.randrange(min(last, 60 * SYNTHETIC_STAMPS_PER_DAY) + 1)
+    start = min(last, end + int(activity * 10) + rng.randrange(30 * SYNTHETIC_STAMPS_PER_DAY))
+    span = start - end + 1
+    random = rng.random
+    username = SYNTHETIC_USERNAME % user_id
+    user = (user_id, username, username + '@example.test', stamps[start], stamps[end],
+            rng.randrange(60) if end < SYNTHETIC_STAMPS_PER_DAY else 0)
+
+    words = []
+    progress = []
+    results = []
+    course = 0 if rng.random() < 0.7 else rng.randrange(len(path))
+    while n_words > 0 and course < len(path):
+        course_id, lessons = path[course]
+        lessons_done = 0
+        for lesson_id, word_ids in lessons:
+            # rng.random() arithmetic rather than randint(): this is the hot loop
+            for word_id in word_ids[:n_words]:
+                when = end + int(random() * span)
+                repetitions = int(random() * 6)
+                interval = INTERVALS[repetitions]
+                due = max(0, when - int(interval * SYNTHETIC_STAMPS_PER_DAY) - 1)
+                words.append((user_id, word_id, stamps[when], 1 + int(random() * 5),
+                              round(1.3 + random() * 1.5, 2), interval, repetitions,
+                              stamps[due]))
+            n_words -= len(word_ids)
+            if n_words < 0:
+                break
+            lessons_done += 1
+            progress.append((user_id, course_id, lesson_id, rng.randint(60, 100),
+                             stamps[rng.randint(end, start)]))
+        if lessons_done and lessons_done * 4 >= len(lessons):
+            percentage = rng.uniform(30, 100)
+            for _ in range(1 + min(3, int(rng.expovariate(1.0)))):
+                score = int(round(percentage * SYNTHETIC_QUESTIONS_PER_COURSE / 100))
+                results.append((user_id, course_id, score, SYNTHETIC_QUESTIONS_PER_COURSE,
+                                score * 100.0 / SYNTHETIC_QUESTIONS_PER_COURSE,
+                                stamps[rng.randint(end, start)]))
+                if percentage >= PASS_PERCENTAGE:
+                    break
+                percentage = min(100.0, percentage + rng.uniform(0, 25))
+        course += 1
+    return user, words, progress, results
+
+def generate_dataset(path, users, seed=1, progress=print):
+    """Add `users` synthetic users and their history to a database.
+
+    Deterministic for a given (users, seed) and day. Triggers and secondary
+    indexes on the user tables are dropped for the load and recreated
+    afterwards, derived counters and course completions are recomputed in
+    bulk, and the load runs without a journal, so a crash mid-way means
+    regenerating the file. Returns (users, learned words, lessons, tests).
+    """
+    ensure_schema(path)
+    conn = sqlite3.connect(path)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    
+    if conn.execute('SELECT COUNT(*) FROM courses').fetchone()[0] == 0:
+        populate_sample_data(conn)
+    first_id = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM users').fetchone()[0]
+    
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    step = timedelta(hours=24 // SYNTHETIC_STAMPS_PER_DAY)
+    stamps = [(today - i * step).strftime('%Y-%m-%d %H:%M:%S')
+              for i in range(SYNTHETIC_HISTORY_DAYS * SYNTHETIC_STAMPS_PER_DAY)]
+    
+    deferred = conn.execute('''
+    SELECT type, name, sql FROM sqlite_master
+    WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN (%s)
+    ''' % ', '.join("'%s'" % t for t in sorted(USER_SCOPED_TABLES))).fetchall()
+    
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA cache_size = -262144')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+    
+    totals = [0, 0, 0]
+    restored = set()
+    try:
+        learning_path = generate_content(conn, rng)
+        conn.commit()
+        
+        for kind, name, _ in deferred:
+            conn.execute('DROP %s IF EXISTS %s' % (kind.upper(), name))
+        conn.commit()
+        
+        password_hash = hashlib.sha256(SYNTHETIC_PASSWORD.encode()).hexdigest()
+        for chunk_start in range(first_id, first_id + users, SYNTHETIC_CHUNK_USERS):
+            chunk_end = min(first_id + users, chunk_start + SYNTHETIC_CHUNK_USERS)
+            user_rows, word_rows, progress_rows, result_rows = [], [], [], []
+            for user_id in range(chunk_start, chunk_end):
+                user, words, lessons, results = synthetic_user_rows(
+                    rng, user_id, learning_path, stamps)
+                user_rows.append(user + (password_hash,))
+                word_rows.extend(words)
+                progress_rows.extend(lessons)
+                result_rows.extend(results)
+            conn.executemany('''
+            INSERT INTO users (id, username, email, created_at, last_login, streak_days,
+                               password_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', user_rows)
+            conn.executemany('''
+            INSERT INTO user_learned_words (user_id, word_id, learned_at, proficiency,
+                                            ease, interval_days, repetitions, due_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', word_rows)
+            conn.executemany('''
+            INSERT INTO user_progress (user_id, course_id, lesson_id, completed, score,
+                                       completed_at)
+            VALUES (?, ?, ?, 1, ?, ?)
+            ''', progress_rows)
+            conn.executemany('''
+            INSERT INTO user_test_results (user_id, course_id, score, total_points,
+                                           percentage, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', result_rows)
+            conn.commit()
+            totals[0] += len(word_rows)
+            totals[1] += len(progress_rows)
+            totals[2] += len(result_rows)
+            progress('  users: %d/%d, learned words: %d, lessons: %d, tests: %d (%.0fs)' % (
+                chunk_end - first_id, users, totals[0], totals[1], totals[2],
+                time.perf_counter() - started))
+        
+        progress('  rebuilding %d index(es)' % sum(1 for d in deferred if d[0] == 'index'))
+        for kind, name, sql in deferred:
+            if kind == 'index':
+                conn.execute(sql)
+                restored.add(name)
+        
+        progress('  recomputing counters and course completion')
+        conn.execute('''
+        INSERT OR IGNORE INTO user_course_completion
+            (user_id, course_id, first_passed_at, best_percentage)
+        SELECT user_id, course_id, MIN(completed_at), MAX(percentage)
+        FROM user_test_results
+        WHERE user_id >= ? AND percentage >= ?
+        GROUP BY user_id, course_id
+        ''', (first_id, PASS_PERCENTAGE))
+        # Every counter the triggers and trophy rules keep on users, from
+        # the same definitions as the migrations that introduced them
+        conn.execute('''
+        UPDATE users SET
+            total_words_learned = (
+                SELECT COUNT(*) FROM user_learned_words WHERE user_id = users.id),
+            total_courses_completed = (
+                SELECT COUNT(*) FROM user_course_completion WHERE user_id = users.id),
+            total_perfect_tests = (
+                SELECT COUNT(*) FROM user_test_results
+                WHERE user_id = users.id AND percentage = 100),
+            total_games_won = (
+                SELECT COUNT(*) FROM user_game_results WHERE user_id = users.id AND won),
+            total_trophies = (
+                SELECT COUNT(*) FROM user_trophies WHERE user_id = users.id)
+        WHERE id >= ?
+        ''', (first_id,))
+        conn.commit()
+    finally:
+        # Indexes and triggers go back even if the load failed part-way
+        for kind, name, sql in deferred:
+            if name not in restored:
+                conn.execute(if_not_exists(sql))
+        conn.commit()
+    
+    progress('  analyzing')
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA locking_mode = NORMAL')
+    conn.execute('PRAGMA journal_mode = WAL')
     conn.close()
-    print("✅ Database setup complete!")
-    print("\nDefault login credentials:")
-    print("  Username: Student123")
-    print("  Password: password123")
+    return users, totals[0], totals[1], totals[2]
+
+def publish_bundles(path, root=None):
+    """Prebuild the course bundles of the database's current catalog
+    version, so servers picking it up only read the manifest"""
+    root = root or os.environ.get('KAZAKH_BUNDLE_DIR', 'bundles')
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        store = BundleStore(root).build(load_catalog(conn))
+    finally:
+        conn.close()
+    print("✅ Built %d course bundle(s) in %s" % (len(store.bundles), root))
+
+def main(argv):
+    command = argv[1] if len(argv) > 1 else 'setup'
+    
+    if command == 'setup':
+        print("Creating Kazakh Learning Platform Database...")
+        conn = create_database()
+        populate_sample_data(conn)
+        conn.close()
+        publish_bundles(DATABASE)
+        print("✅ Database setup complete!")
+        print("\nDefault login credentials:")
+        print("  Username: Student123")
+        print("  Password: password123")
+    elif command == 'migrate':
+        path = argv[2] if len(argv) > 2 else DATABASE
+        applied = ensure_schema(path)
+        if applied:
+            print("✅ Applied migrations: %s" % ', '.join(map(str, applied)))
+        else:
+            print("✅ Schema is up to date")
+    elif command == 'check-plans':
+        # Check against a fresh in-memory schema unless a database is given
+        path = argv[2] if len(argv) > 2 else ':memory:'
+        conn = sqlite3.connect(path)
+        create_schema(conn)
+        migrate(conn)
+        problems = check_query_plans(conn)
+        conn.close()
+        for lineno, sql, detail in problems:
+            print("❌ app.py:%d %s\n   %s" % (lineno, detail, ' '.join(sql.split())))
+        if problems:
+            return 1
+        print("✅ No user-scoped table scans in app.py")
+    elif command == 'generate' and len(argv) > 2:
+        db_path = argv[3] if len(argv) > 3 else DATABASE
+        seed = int(argv[4]) if len(argv) > 4 else 1
+        started = time.perf_counter()
+        users, words, lessons, tests = generate_dataset(db_path, int(argv[2]), seed)
+        print("✅ Generated %d users, %d learned words, %d lessons, %d test results in %.1fs" % (
+            users, words, lessons, tests, time.perf_counter() - started))
+        publish_bundles(db_path)
+    elif command == 'import' and len(argv) > 3:
+        table, path = argv[2], argv[3]
+        db_path = argv[4] if len(argv) > 4 else DATABASE
+        ensure_schema(db_path)
+        conn = sqlite3.connect(db_path)
+        started = time.perf_counter()
+        inserted, updated = import_content(conn, table, path)
+        conn.close()
+        elapsed = time.perf_counter() - started
+        print("✅ Imported %s: %d inserted, %d updated in %.1fs (%.0f rows/sec)" % (
+            table, inserted, updated, elapsed, (inserted + updated) / elapsed if elapsed else 0))
+        publish_bundles(db_path)
+    else:
+        print("Usage: python database.py [setup | migrate [db] | check-plans [db] |")
+        print("                           import <table> <file.csv|file.jsonl> [db] |")
+        print("                           generate <users> [db] [seed]]")
+        return 2
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
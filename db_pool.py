@@ -0,0 +1,145 @@
+import os
+import queue
+import sqlite3
+import threading
+
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,      # negative = KiB, i.e. ~16 MB page cache
+    'mmap_size': 268435456,    # 256 MB
+    'busy_timeout': 5000,      # ms
+}
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the wait time"""
+
+
+class ConnectionPool:
+    """Per-process pool of tuned SQLite connections.
+
+    Connections are created lazily up to `size`. When every connection is
+    checked out, `acquire()` waits up to `timeout` seconds for one to be
+    released. The pool remembers the pid that created it, so a pool built
+    before a gunicorn fork is discarded and rebuilt in each worker rather
+    than sharing file handles across processes.
+    """
+
+    def __init__(self, database, size=5, timeout=5.0, pragmas=None,
+                 cached_statements=256, on_connect=None, factory=sqlite3.Connection):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+        self.cached_statements = cached_statements
+        self.on_connect = on_connect
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.database,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000.0,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self):
+        """Check out a connection, creating one if the pool is not full"""
+        self._check_pid()
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self.hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+                self.misses += 1
+            else:
+                self.waits += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout('No database connection available after %.1fs' % self.timeout)
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if self._pid != os.getpid():
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it and let the pool open a new one
+            with self._lock:
+                self._created -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        """Return hit/miss counters and current pool occupancy"""
+        return {
+            'size': self.size,
+            'open': self._created,
+            'idle': self._idle.qsize(),
+            'in_use': self._created - self._idle.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,161 @@
+import random
+from collections import Counter
+
+
+CHOICES = 4
+DEFAULT_ROUNDS = 50
+MAX_ROUNDS = 200
+
+# Rejection-sampling attempts per distractor group before falling back to
+# a wider group
+_ATTEMPTS_PER_GROUP = 12
+
+
+class DistractorIndex:
+    """Word positions of one catalog snapshot grouped for the name game.
+
+    Distractors for a word come from words of the same type in the same
+    lesson, then the same type anywhere, then any word, so wrong answers
+    look plausible. Groups are tuples of row positions, so picking k
+    distractors is k random indexings rather than a shuffle or an
+    ORDER BY RANDOM().
+    """
+
+    __slots__ = ('version', 'rows', 'answers', 'all', 'by_lesson', 'by_level', 'by_type',
+                 'by_lesson_type', 'lesson_pos', 'type_pos', 'id_pos', 'kazakh_pos',
+                 'pronunciation_pos')
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        words = catalog.words
+        self.rows = words.rows
+        self.id_pos = words.col('id')
+        self.lesson_pos = lesson_pos = words.col('lesson_id')
+        self.type_pos = type_pos = words.col('word_type')
+        self.kazakh_pos = words.col('kazakh')
+        self.pronunciation_pos = words.col('pronunciation')
+        english_pos = words.col('english')
+
+        lessons = catalog.lessons
+        course_of = dict(zip((row[lessons.col('id')] for row in lessons.rows),
+                             (row[lessons.col('course_id')] for row in lessons.rows)))
+        courses = catalog.courses
+        level_of = dict(zip((row[courses.col('id')] for row in courses.rows),
+                            (row[courses.col('level')] for row in courses.rows)))
+
+        by_lesson = {}
+        by_level = {}
+        by_type = {}
+        by_lesson_type = {}
+        for i, row in enumerate(words.rows):
+            by_lesson.setdefault(row[lesson_pos], []).append(i)
+            by_type.setdefault(row[type_pos], []).append(i)
+            by_lesson_type.setdefault((row[lesson_pos], row[type_pos]), []).append(i)
+            level = level_of.get(course_of.get(row[lesson_pos]))
+            if level is not None:
+                by_level.setdefault(level, []).append(i)
+
+        self.answers = tuple(row[english_pos] for row in words.rows)
+        self.all = tuple(range(len(words.rows)))
+        self.by_lesson = {k: tuple(v) for k, v in by_lesson.items()}
+        self.by_level = {k: tuple(v) for k, v in by_level.items()}
+        self.by_type = {k: tuple(v) for k, v in by_type.items()}
+        self.by_lesson_type = {k: tuple(v) for k, v in by_lesson_type.items()}
+
+    def pool(self, lesson_id=None, level=None):
+        if lesson_id is not None:
+            return self.by_lesson.get(lesson_id, ())
+        if level is not None:
+            return self.by_level.get(level, ())
+        return self.all
+
+    def distractors(self, i, rng, count=CHOICES - 1):
+        """Up to `count` distinct wrong answers for the word at position i"""
+        row = self.rows[i]
+        answers = self.answers
+        taken = {answers[i]}
+        chosen = []
+        for group in (self.by_lesson_type.get((row[self.lesson_pos], row[self.type_pos]), ()),
+                      self.by_type.get(row[self.type_pos], ()),
+                      self.all):
+            size = len(group)
+            if size <= 1:
+                continue
+            for _ in range(_ATTEMPTS_PER_GROUP):
+                answer = answers[group[int(rng.random() * size)]]
+                if answer not in taken:
+                    taken.add(answer)
+                    chosen.append(answer)
+                    if len(chosen) == count:
+                        return chosen
+        return chosen
+
+
+class RoundGenerator:
+    """Builds multiple-choice name game rounds from the catalog snapshot;
+    the distractor index is rebuilt when the catalog reloads"""
+
+    def __init__(self):
+        self.index = None
+        self._random = random.Random()
+
+    def load(self, catalog):
+        """Rebuild the distractor index; registered as a catalog reload callback"""
+        self.index = DistractorIndex(catalog)
+
+    def rounds(self, n=DEFAULT_ROUNDS, lesson_id=None, level=None):
+        index = self.index
+        rng = self._random
+        pool = index.pool(lesson_id, level)
+        if not pool:
+            return []
+        # Every word once before any repeats, as the client used to do
+        targets = []
+        while len(targets) < n:
+            targets.extend(rng.sample(pool, min(n - len(targets), len(pool))))
+
+        rows = index.rows
+        rounds = []
+        for i in targets:
+            row = rows[i]
+            answer = index.answers[i]
+            options = index.distractors(i, rng)
+            options.append(answer)
+            rng.shuffle(options)
+            rounds.append({
+                'word_id': row[index.id_pos],
+                'kazakh': row[index.kazakh_pos],
+                'pronunciation': row[index.pronunciation_pos],
+                'options': options,
+                'answer': answer,
+            })
+        return rounds
+
+
+def grade_game(catalog, word_ids, answers):
+    """(correct, best_streak) of a game's answers, [[word_id, answer], ...]
+    in the order they were given, graded against the catalog's English
+    words. Raises ValueError for malformed answers, or more answers to a
+    word than the issued rounds `word_ids` asked."""
+    if not isinstance(answers, list) or len(answers) > len(word_ids):
+        raise ValueError('answers must be a list of at most one answer per round')
+    words = catalog.words
+    english_pos = words.col('english')
+    remaining = Counter(word_ids)
+    correct = streak = best_streak = 0
+    for entry in answers:
+        if not (isinstance(entry, list) and len(entry) == 2
+                and isinstance(entry[0], int) and not isinstance(entry[0], bool)):
+            raise ValueError('Each answer must be [word_id, answer]')
+        word_id, answer = entry
+        if remaining[word_id] <= 0:
+            raise ValueError('Answer to a word that was not issued')
+        remaining[word_id] -= 1
+        row = words.get(word_id)
+        if row is not None and answer == row[english_pos]:
+            correct += 1
+            streak += 1
+            best_streak = max(best_streak, streak)
+        else:
+            streak = 0
+    return correct, best_streak
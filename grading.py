@@ -0,0 +1,190 @@
+import random
+import re
+import threading
+import unicodedata
+
+
+# Separator for accepted alternatives inside course_tests.correct_answer,
+# e.g. "Сәлем|Сәлеметсіз бе"
+VARIANT_SEPARATOR = '|'
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+class _PunctuationToSpace(dict):
+    """str.translate() table mapping every Unicode punctuation character to
+    a space, filled in lazily as characters are first seen"""
+
+    def __missing__(self, codepoint):
+        value = ' ' if unicodedata.category(chr(codepoint)).startswith('P') else None
+        self[codepoint] = value if value else codepoint
+        return self[codepoint]
+
+
+_PUNCTUATION = _PunctuationToSpace()
+
+
+def normalize_strict(text):
+    """NFKC + casefold + trimmed; for answers picked from a fixed option list"""
+    return unicodedata.normalize('NFKC', str(text)).casefold().strip()
+
+
+def normalize_loose(text):
+    """normalize_strict() with punctuation removed and whitespace collapsed"""
+    text = unicodedata.normalize('NFKC', str(text)).casefold().translate(_PUNCTUATION)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+# question_type -> normalizer; register_strategy() adds new types
+STRATEGIES = {}
+
+
+def register_strategy(question_type, normalizer):
+    STRATEGIES[question_type] = normalizer
+
+
+register_strategy('multiple_choice', normalize_strict)
+register_strategy('translation', normalize_loose)
+register_strategy('fill_blank', normalize_loose)
+
+
+class CompiledQuestion:
+    __slots__ = ('id', 'points', 'correct_answer', 'normalize', 'accepted')
+
+    def __init__(self, question_id, points, correct_answer, question_type):
+        self.id = question_id
+        variants = [v.strip() for v in correct_answer.split(VARIANT_SEPARATOR) if v.strip()]
+        self.points = points
+        # The first variant is the one shown to the student
+        self.correct_answer = variants[0] if variants else correct_answer
+        self.normalize = STRATEGIES.get(question_type, normalize_strict)
+        self.accepted = frozenset(self.normalize(v) for v in variants)
+
+    def grade(self, answer):
+        if answer is None:
+            return False
+        return self.normalize(answer) in self.accepted
+
+
+class GradingEngine:
+    """Compiles each course's answer key once per catalog version and grades
+    submissions against it without touching the database"""
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def reset(self, *args):
+        """Drop compiled keys; registered as a catalog reload callback"""
+        with self._lock:
+            self._keys = {}
+
+    def answer_key(self, catalog, course_id):
+        key = self._keys.get((catalog.version, course_id))
+        if key is None:
+            tests = catalog.course_tests
+            id_pos = tests.col('id')
+            points_pos = tests.col('points')
+            answer_pos = tests.col('correct_answer')
+            type_pos = tests.col('question_type')
+            key = {}
+            for i in catalog.tests_by_course.get(course_id, ()):
+                row = tests.rows[i]
+                key[row[id_pos]] = CompiledQuestion(
+                    row[id_pos], 1 if row[points_pos] is None else row[points_pos],
+                    row[answer_pos], row[type_pos])
+            with self._lock:
+                self._keys[(catalog.version, course_id)] = key
+        return key
+
+    def grade(self, questions, answers):
+        """Grade {question_id (str): answer} against compiled questions.
+
+        Returns (score, total_points, results).
+        """
+        score = 0
+        total_points = 0
+        results = []
+        for question in questions:
+            total_points += question.points
+            is_correct = question.grade(answers.get(str(question.id)))
+            if is_correct:
+                score += question.points
+            results.append({
+                'question_id': question.id,
+                'correct': is_correct,
+                'correct_answer': question.correct_answer
+            })
+        return score, total_points, results
+
+
+class QuestionBank:
+    """A course's question ids split into strata by (question_type, points)"""
+
+    __slots__ = ('strata', 'size')
+
+    def __init__(self, strata):
+        self.strata = strata
+        self.size = sum(len(ids) for ids in strata)
+
+    def quotas(self, n):
+        """Questions to draw from each stratum: proportional to its size,
+        with leftover seats going to the largest remainders"""
+        if not self.size:
+            return []
+        n = min(n, self.size)
+        exact = [n * len(ids) / self.size for ids in self.strata]
+        quotas = [int(share) for share in exact]
+        leftover = n - sum(quotas)
+        by_remainder = sorted(range(len(exact)), key=lambda i: quotas[i] - exact[i])
+        for i in by_remainder[:leftover]:
+            quotas[i] += 1
+        return quotas
+
+
+class TestSampler:
+    """Draws stratified random samples of a course's test questions.
+
+    Each course's id strata are built once per catalog version, so a sample
+    is a random.sample() per stratum instead of an ORDER BY RANDOM() over
+    course_tests. A seed makes the draw repeatable (the same user retaking
+    with the same seed gets the same questions); without one every call
+    draws afresh.
+    """
+
+    def __init__(self):
+        self._banks = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def reset(self, *args):
+        """Drop cached banks; registered as a catalog reload callback"""
+        with self._lock:
+            self._banks = {}
+
+    def bank(self, catalog, course_id):
+        bank = self._banks.get((catalog.version, course_id))
+        if bank is None:
+            tests = catalog.course_tests
+            id_pos = tests.col('id')
+            type_pos = tests.col('question_type')
+            points_pos = tests.col('points')
+            strata = {}
+            for i in catalog.tests_by_course.get(course_id, ()):
+                row = tests.rows[i]
+                strata.setdefault((row[type_pos], row[points_pos]), []).append(row[id_pos])
+            bank = QuestionBank(tuple(tuple(ids) for _, ids in sorted(
+                strata.items(), key=lambda item: (str(item[0][0]), item[0][1] or 0))))
+            with self._lock:
+                self._banks[(catalog.version, course_id)] = bank
+        return bank
+
+    def sample(self, catalog, course_id, n, seed=None):
+        """Up to n question ids in random order"""
+        bank = self.bank(catalog, course_id)
+        rng = self._random if seed is None else random.Random(seed)
+        ids = []
+        for stratum, quota in zip(bank.strata, bank.quotas(n)):
+            ids.extend(rng.sample(stratum, quota))
+        rng.shuffle(ids)
+        return ids
@@ -0,0 +1,265 @@
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+
+# Global boards and the users column (or derived score) behind each
+GLOBAL_BOARDS = ('words', 'courses', 'trophies', 'weekly_xp')
+
+XP_PER_WORD = 10
+XP_PER_LESSON = 50
+
+
+class Board:
+    """Order-statistic ranking of users by an integer score.
+
+    A Fenwick tree over score values counts users per score, so the number
+    of users ahead of a score is an O(log M) prefix sum. Users sharing a
+    score live in a sorted bucket, which gives a total order of
+    (score desc, user_id asc) with O(log n) position lookups and
+    position -> user lookups.
+    """
+
+    __slots__ = ('scores', 'buckets', 'tree', 'capacity', 'total')
+
+    def __init__(self, items=()):
+        self.scores = {}
+        self.buckets = {}
+        self.total = 0
+        self.capacity = 1
+        for user_id, score in items:
+            score = max(0, int(score))
+            self.scores[user_id] = score
+            self.buckets.setdefault(score, []).append(user_id)
+            self.capacity = max(self.capacity, score + 1)
+        for bucket in self.buckets.values():
+            bucket.sort()
+        self.total = len(self.scores)
+        self._rebuild_tree(self.capacity)
+
+    def _rebuild_tree(self, capacity):
+        size = 1
+        while size < capacity:
+            size *= 2
+        self.capacity = size
+        tree = [0] * (size + 1)
+        for score, bucket in self.buckets.items():
+            tree[score + 1] += len(bucket)
+        # Linear-time Fenwick construction
+        for i in range(1, size + 1):
+            j = i + (i & -i)
+            if j <= size:
+                tree[j] += tree[i]
+        self.tree = tree
+
+    def _add(self, score, delta):
+        i = score + 1
+        tree = self.tree
+        while i <= self.capacity:
+            tree[i] += delta
+            i += i & -i
+
+    def _count_at_most(self, score):
+        """Number of users with score <= `score`"""
+        i = min(score + 1, self.capacity)
+        count = 0
+        tree = self.tree
+        while i > 0:
+            count += tree[i]
+            i -= i & -i
+        return count
+
+    def _score_of_lowest(self, j):
+        """Score of the j-th lowest user (0-based)"""
+        pos = 0
+        step = self.capacity
+        tree = self.tree
+        while step:
+            nxt = pos + step
+            if nxt <= self.capacity and tree[nxt] <= j:
+                pos = nxt
+                j -= tree[nxt]
+            step //= 2
+        return pos
+
+    def set(self, user_id, score):
+        score = max(0, int(score))
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            bucket = self.buckets[old]
+            del bucket[bisect_left(bucket, user_id)]
+            if not bucket:
+                del self.buckets[old]
+            self._add(old, -1)
+        else:
+            self.total += 1
+        if score >= self.capacity:
+            self.scores[user_id] = score
+            insort(self.buckets.setdefault(score, []), user_id)
+            self._rebuild_tree(score + 1)
+            return
+        self.scores[user_id] = score
+        insort(self.buckets.setdefault(score, []), user_id)
+        self._add(score, 1)
+
+    def position(self, user_id):
+        """0-based position in (score desc, user_id asc) order, or None"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        ahead = self.total - self._count_at_most(score)
+        return ahead + bisect_left(self.buckets[score], user_id)
+
+    def rank(self, user_id):
+        """Competition rank (users with equal scores share a rank), or None"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.total - self._count_at_most(score) + 1
+
+    def entry(self, position):
+        """(user_id, score, rank) at a 0-based position"""
+        score = self._score_of_lowest(self.total - 1 - position)
+        ahead = self.total - self._count_at_most(score)
+        return self.buckets[score][position - ahead], score, ahead + 1
+
+    def slice(self, start, stop):
+        start = max(0, start)
+        stop = min(self.total, stop)
+        entries = []
+        position = start
+        while position < stop:
+            user_id, score, rank = self.entry(position)
+            bucket = self.buckets[score]
+            offset = position - (rank - 1)
+            for user_id in bucket[offset:offset + stop - position]:
+                entries.append((user_id, score, rank))
+                position += 1
+        return entries
+
+
+def week_start(now=None):
+    """UTC date of this week's Monday; matches date('now', 'weekday 0', '-6 days')"""
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=now.weekday())).date().isoformat()
+
+
+class Leaderboards:
+    """Per-process leaderboards rebuilt from SQLite and kept current by
+    tailing leaderboard_changes, which triggers append to on every score
+    change, so writes handled by other workers show up within
+    `poll_interval` seconds."""
+
+    def __init__(self, database, poll_interval=0.5, retention_seconds=3600):
+        self.database = database
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self.boards = {}
+        self.last_seq = 0
+        self.week = None
+        self._polled_at = 0.0
+        self._pruned_at = 0.0
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.database, check_same_thread=False,
+                                         isolation_level=None)
+            self._pid = os.getpid()
+        return self._conn
+
+    def rebuild(self):
+        """Load every board from scratch inside one read transaction"""
+        with self._lock:
+            conn = self._connection()
+            week = week_start()
+            conn.execute('BEGIN')
+            try:
+                last_seq = conn.execute(
+                    'SELECT COALESCE(MAX(seq), 0) FROM leaderboard_changes').fetchone()[0]
+                rows = conn.execute('''
+                SELECT id, total_words_learned, total_courses_completed, total_trophies
+                FROM users
+                ''').fetchall()
+                boards = {
+                    'words': Board((r[0], r[1] or 0) for r in rows),
+                    'courses': Board((r[0], r[2] or 0) for r in rows),
+                    'trophies': Board((r[0], r[3] or 0) for r in rows),
+                }
+                xp = dict.fromkeys((r[0] for r in rows), 0)
+                for user_id, count in conn.execute('''
+                SELECT user_id, COUNT(*) FROM user_learned_words
+                WHERE learned_at >= ? GROUP BY user_id
+                ''', (week,)):
+                    xp[user_id] = xp.get(user_id, 0) + XP_PER_WORD * count
+                for user_id, count in conn.execute('''
+                SELECT user_id, COUNT(*) FROM user_progress
+                WHERE completed = 1 AND completed_at >= ? GROUP BY user_id
+                ''', (week,)):
+                    xp[user_id] = xp.get(user_id, 0) + XP_PER_LESSON * count
+                boards['weekly_xp'] = Board(xp.items())
+
+                per_course = {}
+                for user_id, course_id, count in conn.execute('''
+                SELECT user_id, course_id, COUNT(*) FROM user_progress
+                WHERE completed = 1 GROUP BY user_id, course_id
+                '''):
+                    per_course.setdefault(course_id, []).append((user_id, count))
+                for course_id, items in per_course.items():
+                    boards['course:%d' % course_id] = Board(items)
+            finally:
+                conn.execute('ROLLBACK')
+            self.boards = boards
+            self.last_seq = last_seq
+            self.week = week
+            self._polled_at = time.monotonic()
+
+    def refresh(self):
+        """Apply score changes logged since the last poll"""
+        if self.week != week_start():
+            self.rebuild()
+            return
+        if time.monotonic() - self._polled_at < self.poll_interval:
+            return
+        with self._lock:
+            if time.monotonic() - self._polled_at < self.poll_interval:
+                return
+            conn = self._connection()
+            oldest = conn.execute('SELECT MIN(seq) FROM leaderboard_changes').fetchone()[0]
+            newest = conn.execute('''
+            SELECT seq FROM sqlite_sequence WHERE name = 'leaderboard_changes'
+            ''').fetchone()
+            newest = newest[0] if newest else 0
+            if (oldest is None and newest > self.last_seq) or \
+                    (oldest is not None and oldest > self.last_seq + 1):
+                # Changes we never saw were pruned; start over
+                rebuild = True
+            else:
+                rebuild = False
+                for seq, user_id, board, score in conn.execute('''
+                SELECT seq, user_id, board, score FROM leaderboard_changes
+                WHERE seq > ? ORDER BY seq
+                ''', (self.last_seq,)):
+                    if board not in self.boards:
+                        self.boards[board] = Board()
+                    self.boards[board].set(user_id, score)
+                    self.last_seq = seq
+                self._polled_at = time.monotonic()
+                if self._polled_at - self._pruned_at > 60:
+                    self._pruned_at = self._polled_at
+                    conn.execute('''
+                    DELETE FROM leaderboard_changes WHERE changed_at < datetime('now', ?)
+                    ''', ('-%d seconds' % self.retention_seconds,))
+        if rebuild:
+            self.rebuild()
+
+    def board(self, name):
+        self.refresh()
+        return self.boards.get(name)
@@ -0,0 +1,304 @@
+import sqlite3
+import threading
+from time import perf_counter
+
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Statements-per-request histogram buckets
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class SQLStats:
+    """Statements issued and time spent in SQLite during one request.
+
+    `on_slow(sql, parameters, seconds)` is called for statements taking at
+    least `slow_seconds`, counting execution and the fetches of its rows.
+    """
+
+    __slots__ = ('statements', 'seconds', 'slow_seconds', 'on_slow')
+
+    def __init__(self, slow_seconds=None, on_slow=None):
+        self.statements = 0
+        self.seconds = 0.0
+        self.slow_seconds = slow_seconds
+        self.on_slow = on_slow
+
+    def statement(self, sql, parameters, seconds):
+        """Count an executed statement; True if it was reported as slow"""
+        self.statements += 1
+        self.seconds += seconds
+        return self.slow(sql, parameters, seconds)
+
+    def fetched(self, sql, parameters, seconds, total):
+        """Count a fetch taking `seconds`, `total` being the time spent on
+        its statement so far; True if the statement was reported as slow"""
+        self.seconds += seconds
+        return self.slow(sql, parameters, total)
+
+    def slow(self, sql, parameters, seconds):
+        if self.on_slow is not None and seconds >= self.slow_seconds:
+            self.on_slow(sql, parameters, seconds)
+            return True
+        return False
+
+
+_cursor_execute = sqlite3.Cursor.execute
+_cursor_executemany = sqlite3.Cursor.executemany
+_cursor_fetchone = sqlite3.Cursor.fetchone
+_cursor_fetchmany = sqlite3.Cursor.fetchmany
+_cursor_fetchall = sqlite3.Cursor.fetchall
+_connection_cursor = sqlite3.Connection.cursor
+_connection_commit = sqlite3.Connection.commit
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports execute and fetch timings to its connection's
+    observer. Rows read by iterating the cursor are not timed; fetchone(),
+    fetchmany() and fetchall() are, and their time is added to the statement
+    that produced the rows. A statement is reported as slow once, as soon as
+    its execute and fetch time together reach the threshold.
+
+    The base methods are called unbound rather than through super(), which
+    keeps the overhead to one or two microseconds per statement.
+    """
+
+    # The statement whose rows are being fetched and the time spent on it,
+    # or None once it has been reported as slow
+    _sql = None
+    _parameters = None
+    _elapsed = 0.0
+
+    def execute(self, sql, parameters=()):
+        observer = self.connection.observer
+        if observer is None:
+            return _cursor_execute(self, sql, parameters)
+        started = perf_counter()
+        try:
+            return _cursor_execute(self, sql, parameters)
+        finally:
+            seconds = perf_counter() - started
+            if observer.statement(sql, parameters, seconds):
+                self._sql = None
+            else:
+                self._sql = sql
+                self._parameters = parameters
+                self._elapsed = seconds
+
+    def executemany(self, sql, seq_of_parameters):
+        observer = self.connection.observer
+        if observer is None:
+            return _cursor_executemany(self, sql, seq_of_parameters)
+        started = perf_counter()
+        try:
+            return _cursor_executemany(self, sql, seq_of_parameters)
+        finally:
+            self._sql = None
+            observer.statement(sql, None, perf_counter() - started)
+
+    def _fetched(self, observer, seconds):
+        if self._sql is None:
+            observer.seconds += seconds
+            return
+        self._elapsed += seconds
+        if observer.fetched(self._sql, self._parameters, seconds, self._elapsed):
+            self._sql = None
+
+    def fetchone(self):
+        observer = self.connection.observer
+        if observer is None:
+            return _cursor_fetchone(self)
+        started = perf_counter()
+        try:
+            return _cursor_fetchone(self)
+        finally:
+            self._fetched(observer, perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        observer = self.connection.observer
+        size = self.arraysize if size is None else size
+        if observer is None:
+            return _cursor_fetchmany(self, size)
+        started = perf_counter()
+        try:
+            return _cursor_fetchmany(self, size)
+        finally:
+            self._fetched(observer, perf_counter() - started)
+
+    def fetchall(self):
+        observer = self.connection.observer
+        if observer is None:
+            return _cursor_fetchall(self)
+        started = perf_counter()
+        try:
+            return _cursor_fetchall(self)
+        finally:
+            self._fetched(observer, perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection factory whose cursors report to `observer`.
+
+    sqlite3.Connection.execute() does not go through cursor(), so the
+    shortcut methods are routed through an instrumented cursor explicitly.
+    """
+
+    observer = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return _connection_cursor(self, factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        observer = self.observer
+        if observer is None:
+            return _connection_commit(self)
+        started = perf_counter()
+        try:
+            return _connection_commit(self)
+        finally:
+            observer.statement('COMMIT', None, perf_counter() - started)
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name, labels):
+        """Cumulative Prometheus bucket/sum/count samples"""
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield name + '_bucket', dict(labels, le=format_value(bound)), cumulative
+        yield name + '_bucket', dict(labels, le='+Inf'), self.count
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class EndpointStats:
+    __slots__ = ('responses', 'latency', 'statements', 'sql_statements', 'sql_seconds')
+
+    def __init__(self):
+        self.responses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_sample(name, labels, value):
+    if labels:
+        label_text = ','.join('%s="%s"' % (k, escape_label(v)) for k, v in labels.items())
+        return '%s{%s} %s' % (name, label_text, format_value(value))
+    return '%s %s' % (name, format_value(value))
+
+
+class Metrics:
+    """Per-process request and SQL metrics rendered in Prometheus text format.
+
+    Under gunicorn each worker keeps its own numbers; a scrape reports the
+    worker that happened to serve it, labelled with its pid.
+    """
+
+    def __init__(self, prefix='kazakh'):
+        self.prefix = prefix
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, seconds, sql):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            key = (method, status)
+            stats.responses[key] = stats.responses.get(key, 0) + 1
+            stats.latency.observe(seconds)
+            stats.statements.observe(sql.statements)
+            stats.sql_statements += sql.statements
+            stats.sql_seconds += sql.seconds
+
+    def render(self, gauges=(), labels=None):
+        """Prometheus exposition text.
+
+        `gauges` is an iterable of (name, help, type, value) for point-in-time
+        values owned by other components (pool, caches, queues).
+        """
+        base = dict(labels or {})
+        prefix = self.prefix
+        lines = []
+
+        def family(name, help_text, metric_type, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, metric_type))
+            for sample_name, sample_labels, value in samples:
+                lines.append(format_sample('%s_%s' % (prefix, sample_name),
+                                           sample_labels, value))
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            family('http_requests_total', 'Requests handled, by endpoint, method and status',
+                   'counter', [
+                       ('http_requests_total',
+                        dict(base, endpoint=endpoint, method=method, status=status), count)
+                       for endpoint, stats in endpoints
+                       for (method, status), count in sorted(stats.responses.items())
+                   ])
+            family('http_request_duration_seconds', 'Request latency', 'histogram', [
+                sample
+                for endpoint, stats in endpoints
+                for sample in stats.latency.samples(
+                    'http_request_duration_seconds', dict(base, endpoint=endpoint))
+            ])
+            family('sql_statements_per_request', 'SQL statements issued per request',
+                   'histogram', [
+                       sample
+                       for endpoint, stats in endpoints
+                       for sample in stats.statements.samples(
+                           'sql_statements_per_request', dict(base, endpoint=endpoint))
+                   ])
+            family('sql_statements_total', 'SQL statements issued through get_db()',
+                   'counter', [
+                       ('sql_statements_total', dict(base, endpoint=endpoint),
+                        stats.sql_statements)
+                       for endpoint, stats in endpoints
+                   ])
+            family('sql_duration_seconds_total',
+                   'Time spent executing and fetching SQL through get_db()', 'counter', [
+                       ('sql_duration_seconds_total', dict(base, endpoint=endpoint),
+                        stats.sql_seconds)
+                       for endpoint, stats in endpoints
+                   ])
+
+        for name, help_text, metric_type, value in gauges:
+            family(name, help_text, metric_type, [(name, base, value)])
+
+        return '\n'.join(lines) + '\n'
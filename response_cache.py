@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class CachedResponse:
+    """Final serialized body of one response, plus its gzip form and ETag"""
+
+    __slots__ = ('body', 'gzip_body', 'etag', 'mimetype')
+
+    def __init__(self, body, mimetype, gzip_min_size=1024, gzip_level=6):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzip_body = None
+        if len(body) >= gzip_min_size:
+            compressed = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+            if len(compressed) < len(body):
+                self.gzip_body = compressed
+
+    @property
+    def size(self):
+        return len(self.body) + (len(self.gzip_body) if self.gzip_body else 0)
+
+
+class ResponseCache:
+    """LRU cache of serialized response bodies bounded by a byte budget.
+
+    Keys are built by the caller and should include everything the body
+    depends on (endpoint, arguments and catalog version). `invalidate()` is
+    the hook to call whenever catalog tables change.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, gzip_min_size=1024):
+        self.max_bytes = max_bytes
+        self.gzip_min_size = gzip_min_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype='application/json'):
+        entry = CachedResponse(body, mimetype, self.gzip_min_size)
+        if entry.size > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.size
+            self._entries[key] = entry
+            self.bytes += entry.size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.size
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, *args):
+        """Drop every entry; safe to register directly as a reload callback"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
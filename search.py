@@ -0,0 +1,59 @@
+import re
+
+
+# Kazakh-specific Cyrillic letters folded onto their closest Russian base
+# letter, so "әке" matches "аке" and "үй" matches "уй". Case folding and
+# ordinary diacritics (ё -> е, й -> и, Latin accents) are left to the FTS5
+# unicode61 tokenizer.
+KAZAKH_FOLD = {
+    'ә': 'а', 'ғ': 'г', 'қ': 'к', 'ң': 'н', 'ө': 'о',
+    'ұ': 'у', 'ү': 'у', 'һ': 'х', 'і': 'и',
+    'Ә': 'А', 'Ғ': 'Г', 'Қ': 'К', 'Ң': 'Н', 'Ө': 'О',
+    'Ұ': 'У', 'Ү': 'У', 'Һ': 'Х', 'І': 'И',
+}
+
+_FOLD_TABLE = str.maketrans(KAZAKH_FOLD)
+
+# FTS columns searched for each ?lang= value; pronunciation holds the Latin
+# transliteration of the Kazakh word
+LANGUAGE_COLUMNS = {
+    'kk': ('kazakh', 'pronunciation'),
+    'en': ('english',),
+    'ru': ('russian',),
+}
+
+# bm25 weights, in words_fts column order
+RANK_WEIGHTS = (10.0, 6.0, 6.0, 8.0, 1.0)
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(text):
+    """Fold Kazakh-specific letters the same way the FTS triggers do"""
+    return text.translate(_FOLD_TABLE)
+
+
+def fold_sql(expr):
+    """SQL expression applying fold() to expr with nested replace() calls.
+
+    Plain SQL keeps the sync triggers working on every connection, including
+    ones that never registered a Python function (sqlite3 shell, importers).
+    """
+    for source, target in KAZAKH_FOLD.items():
+        expr = "replace(%s, '%s', '%s')" % (expr, source, target)
+    return expr
+
+
+def build_match(query, lang=None):
+    """FTS5 MATCH expression: every token must match as a prefix.
+
+    Returns None when the query contains no searchable tokens.
+    """
+    tokens = _TOKEN.findall(fold(query))
+    if not tokens:
+        return None
+    terms = ' '.join('"%s"*' % token for token in tokens)
+    columns = LANGUAGE_COLUMNS.get(lang)
+    if columns:
+        return '{%s} : (%s)' % (' '.join(columns), terms)
+    return terms
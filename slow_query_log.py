@@ -0,0 +1,208 @@
+import glob
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+# Statements EXPLAIN QUERY PLAN can say something useful about
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+# Re-explain a fingerprint at most this often; plans change as data grows
+EXPLAIN_EVERY_SECONDS = 60
+
+
+def normalize_sql(sql):
+    """SQL with literals replaced by ? and whitespace collapsed, so every
+    execution of the same statement shape shares one fingerprint"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (?+)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:12]
+
+
+def value_shape(value):
+    if isinstance(value, (str, bytes)):
+        return '%s[%d]' % (type(value).__name__, len(value))
+    return type(value).__name__
+
+
+def parameter_shape(parameters):
+    """Types (and string lengths) of bound parameters, never their values"""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {key: value_shape(value) for key, value in parameters.items()}
+    return [value_shape(value) for value in parameters]
+
+
+class SlowQueryLog:
+    """Writes statements slower than `threshold_ms` to a rotating NDJSON file.
+
+    Each entry carries the normalized SQL and its fingerprint, parameter
+    shapes, duration, endpoint and the statement's EXPLAIN QUERY PLAN, run on
+    the same connection right after the slow execution. Rotation is per
+    process; under gunicorn every worker appends to the same file, which is
+    fine for whole-line writes but may occasionally rotate twice.
+    """
+
+    def __init__(self, path, threshold_ms=100.0, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.path = path
+        self.threshold = threshold_ms / 1000.0
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.logged = 0
+        self._logger = None
+        self._explained = {}
+        self._lock = threading.Lock()
+
+    def _get_logger(self):
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    handler = logging.handlers.RotatingFileHandler(
+                        self.path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                        encoding='utf-8', delay=True)
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    logger = logging.getLogger('%s.%s' % (__name__, id(self)))
+                    logger.propagate = False
+                    logger.setLevel(logging.INFO)
+                    logger.addHandler(handler)
+                    self._logger = logger
+        return self._logger
+
+    def explain(self, conn, sql, parameters, key):
+        """EXPLAIN QUERY PLAN detail lines, or None if skipped"""
+        if parameters is None or not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        now = time.monotonic()
+        if now - self._explained.get(key, -EXPLAIN_EVERY_SECONDS) < EXPLAIN_EVERY_SECONDS:
+            return None
+        self._explained[key] = now
+        try:
+            # The base class execute() bypasses any instrumented cursor
+            rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql,
+                                              parameters).fetchall()
+        except sqlite3.Error as e:
+            return ['error: %s' % e]
+        return [row[3] for row in rows]
+
+    def record(self, conn, sql, parameters, seconds, endpoint=None):
+        normalized = normalize_sql(sql)
+        key = fingerprint(normalized)
+        entry = {
+            'ts': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'fingerprint': key,
+            'sql': normalized,
+            'params': parameter_shape(parameters),
+            'duration_ms': round(seconds * 1000, 3),
+            'endpoint': endpoint,
+            'pid': os.getpid(),
+            'plan': self.explain(conn, sql, parameters, key),
+        }
+        self._get_logger().info(json.dumps(entry, ensure_ascii=False))
+        self.logged += 1
+
+
+# ============= SUMMARY =============
+
+def read_entries(paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+def summarize(entries):
+    """Per-fingerprint count, total/p95/max duration, endpoints and latest plan"""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['fingerprint'], {
+            'fingerprint': entry['fingerprint'],
+            'sql': entry['sql'],
+            'durations': [],
+            'endpoints': set(),
+            'plan': None,
+        })
+        group['durations'].append(entry['duration_ms'])
+        if entry.get('endpoint'):
+            group['endpoints'].add(entry['endpoint'])
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+    summary = []
+    for group in groups.values():
+        durations = sorted(group.pop('durations'))
+        group.update({
+            'count': len(durations),
+            'total_ms': round(sum(durations), 3),
+            'p95_ms': percentile(durations, 95),
+            'max_ms': durations[-1],
+            'endpoints': sorted(group['endpoints']),
+        })
+        summary.append(group)
+    return summary
+
+def main(argv):
+    args = argv[1:]
+    if not args or args[0] != 'summarize':
+        print("Usage: python slow_query_log.py summarize [log.ndjson ...] "
+              "[--sort total|count|p95] [--top N]")
+        return 2
+    sort_key = 'total_ms'
+    top = 20
+    paths = []
+    rest = iter(args[1:])
+    for arg in rest:
+        if arg == '--sort':
+            sort_key = {'total': 'total_ms', 'count': 'count', 'p95': 'p95_ms'}[next(rest)]
+        elif arg == '--top':
+            top = int(next(rest))
+        else:
+            paths.append(arg)
+    if not paths:
+        path = os.environ.get('KAZAKH_SLOW_QUERY_LOG', 'slow_queries.ndjson')
+        # Oldest rotated file first
+        paths = sorted(glob.glob(path + '.*'), reverse=True) + [path]
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths:
+        print("No slow query log found")
+        return 1
+
+    summary = sorted(summarize(read_entries(paths)), key=lambda s: s[sort_key], reverse=True)
+    for group in summary[:top]:
+        print("%s  count=%d  total=%.1fms  p95=%.1fms  max=%.1fms  %s" % (
+            group['fingerprint'], group['count'], group['total_ms'], group['p95_ms'],
+            group['max_ms'], ', '.join(group['endpoints'])))
+        print("    %s" % group['sql'])
+        for detail in group['plan'] or ():
+            print("    %s %s" % ('⚠️ ' if detail.startswith('SCAN') else '  ', detail))
+    print("\n%d statement shape(s) in %s" % (len(summary), ', '.join(paths)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
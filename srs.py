@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+
+MIN_EASE = 1.3
+DEFAULT_EASE = 2.5
+
+# Timestamps are stored in the same UTC text format as CURRENT_TIMESTAMP so
+# that due_at compares correctly as a string inside the (user_id, due_at) index
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def utc_timestamp(moment=None):
+    """UTC time formatted like SQLite's CURRENT_TIMESTAMP"""
+    return (moment or datetime.utcnow()).strftime(TIMESTAMP_FORMAT)
+
+
+def sm2(ease, interval_days, repetitions, grade):
+    """Apply one SM-2 review.
+
+    grade is the recall quality from 0 (blackout) to 5 (perfect). Returns
+    the new (ease, interval_days, repetitions).
+    """
+    if grade < 3:
+        repetitions = 0
+        interval_days = 1
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval_days = 1
+        elif repetitions == 2:
+            interval_days = 6
+        else:
+            interval_days = round(interval_days * ease, 2)
+
+    ease = ease + (0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    return max(MIN_EASE, round(ease, 4)), interval_days, repetitions
+
+
+def schedule(state, grade, now=None):
+    """New scheduling columns for a card after a review graded `grade`"""
+    now = now or datetime.utcnow()
+    ease, interval_days, repetitions = sm2(
+        state['ease'] if state['ease'] is not None else DEFAULT_EASE,
+        state['interval_days'] or 0,
+        state['repetitions'] or 0,
+        grade,
+    )
+    return {
+        'ease': ease,
+        'interval_days': interval_days,
+        'repetitions': repetitions,
+        'due_at': utc_timestamp(now + timedelta(days=interval_days)),
+    }
@@ -0,0 +1,164 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Only these file types are ever served; source, databases and config stay private
+ASSET_EXTENSIONS = {
+    '.html', '.css', '.js', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp',
+    '.ico', '.woff', '.woff2', '.ttf', '.mp3', '.wav', '.webmanifest',
+}
+
+# Build tooling that happens to share an asset extension
+EXCLUDED_FILES = {'eslint.config.js'}
+EXCLUDED_DIRS = {'node_modules', 'dist', '__pycache__'}
+
+# Already-compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'image/svg+xml', 'application/json',
+                      'application/manifest+json')
+
+COMPRESS_MIN_SIZE = 512
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# src="..." / href="..." references rewritten to fingerprinted URLs in HTML
+_REFERENCE = re.compile(r'''\b(src|href)=(["'])([^"'#?:]+)\2''')
+
+
+class Asset:
+    """One static file with its precompressed encodings.
+
+    `encodings` maps content-coding -> body, always including 'identity'.
+    """
+
+    __slots__ = ('path', 'url', 'mimetype', 'etag', 'encodings')
+
+    def __init__(self, path, body):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.mimetype.startswith('text/') or self.mimetype == 'application/javascript':
+            self.mimetype += '; charset=utf-8'
+        digest = hashlib.sha256(body).hexdigest()
+        self.etag = digest[:20]
+        self.encodings = {'identity': body}
+        if path.endswith('.html'):
+            # Pages keep their names (they are linked to and bookmarked)
+            self.url = path
+        else:
+            stem, ext = os.path.splitext(path)
+            self.url = '%s.%s%s' % (stem, digest[:10], ext)
+        if len(body) >= COMPRESS_MIN_SIZE and self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body):
+                self.encodings['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(body, quality=11)
+                if len(compressed) < len(body):
+                    self.encodings['br'] = compressed
+
+    def negotiate(self, accept_encodings):
+        """Smallest encoding the client accepts: br, then gzip, then identity"""
+        for coding in ('br', 'gzip'):
+            if coding in self.encodings and accept_encodings[coding]:
+                return coding
+        return 'identity'
+
+
+class AssetTable:
+    """Static files read, fingerprinted and compressed once at startup.
+
+    Every asset is reachable under its plain name (revalidated with its
+    ETag) and, except HTML pages, under a content-hashed name such as
+    styles.3f2a9c1b2d.css that is cached forever. References to assets in
+    HTML pages are rewritten to the hashed names, so a deploy changes the
+    page and every changed asset gets a new URL. Lookups are a dict get; no
+    filesystem access happens per request.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.routes = {}
+
+    def build(self):
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames
+                           if not d.startswith('.') and d not in EXCLUDED_DIRS]
+            for filename in filenames:
+                if filename in EXCLUDED_FILES or filename.startswith('.'):
+                    continue
+                if os.path.splitext(filename)[1].lower() not in ASSET_EXTENSIONS:
+                    continue
+                full = os.path.join(dirpath, filename)
+                path = os.path.relpath(full, self.root).replace(os.sep, '/')
+                with open(full, 'rb') as f:
+                    files[path] = f.read()
+
+        # Non-HTML assets first, so pages can point at their hashed URLs
+        assets = {path: Asset(path, body) for path, body in files.items()
+                  if not path.endswith('.html')}
+        for path, body in files.items():
+            if path.endswith('.html'):
+                assets[path] = Asset(path, self.rewrite(path, body, assets))
+
+        routes = {}
+        for asset in assets.values():
+            routes[asset.path] = (asset, False)
+            if asset.url != asset.path:
+                routes[asset.url] = (asset, True)
+        self.assets = assets
+        self.routes = routes
+        return self
+
+    def rewrite(self, page, body, assets):
+        base = os.path.dirname(page)
+
+        def replace(match):
+            attribute, quote, target = match.groups()
+            path = os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+            asset = assets.get(path)
+            if asset is None:
+                return match.group(0)
+            url = os.path.relpath(asset.url, base or '.').replace(os.sep, '/')
+            return '%s=%s%s%s' % (attribute, quote, url, quote)
+
+        return _REFERENCE.sub(replace, body.decode('utf-8')).encode('utf-8')
+
+    def lookup(self, path):
+        """(asset, immutable) for a request path, or (None, False)"""
+        return self.routes.get(path, (None, False))
+
+    def url_for(self, path):
+        asset = self.assets.get(path)
+        return asset.url if asset is not None else path
+
+    def manifest(self):
+        return {path: {
+            'url': asset.url,
+            'etag': asset.etag,
+            'sizes': {coding: len(body) for coding, body in asset.encodings.items()},
+        } for path, asset in sorted(self.assets.items())}
+
+
+def main(argv):
+    root = argv[1] if len(argv) > 1 else os.path.dirname(os.path.abspath(__file__))
+    table = AssetTable(root).build()
+    for path, entry in table.manifest().items():
+        print("%-24s %-32s %s" % (path, entry['url'], ', '.join(
+            '%s=%d' % item for item in entry['sizes'].items())))
+    if brotli is None:
+        print("(brotli not installed; serving gzip only)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,110 @@
+import json
+import time
+
+
+# Entities recorded in user_sync_log, as sent to clients:
+# name -> (table, key column, columns)
+ENTITIES = {
+    'words': ('user_learned_words', 'word_id',
+              ('word_id', 'proficiency', 'learned_at', 'ease', 'interval_days', 'repetitions',
+               'due_at')),
+    'lessons': ('user_progress', 'lesson_id',
+                ('lesson_id', 'course_id', 'completed', 'score', 'completed_at')),
+    'tests': ('user_test_results', 'id',
+              ('id', 'course_id', 'score', 'total_points', 'percentage', 'completed_at')),
+    'trophies': ('user_trophies', 'trophy_id', ('trophy_id', 'earned_at')),
+    'courses': ('user_course_completion', 'course_id',
+                ('course_id', 'first_passed_at', 'best_percentage')),
+}
+
+
+def encode_token(seq):
+    return str(seq)
+
+
+def decode_token(token):
+    """Sequence number of a sync token; raises ValueError if malformed"""
+    seq = int(str(token))
+    if seq < 0:
+        raise ValueError('Invalid sync token')
+    return seq
+
+
+class SyncLog:
+    """Reads a user's changes from the trigger-fed user_sync_log.
+
+    Every write to a user table appends (user_id, entity, entity_id) under a
+    global monotonic seq, and a client's sync token is the last seq it has
+    seen. Catching up is a range scan on (user_id, seq) followed by primary
+    key lookups for the rows that changed, so it costs the size of the
+    delta, not the user's history. Entries older than `retention_days` are
+    pruned; clients holding a token from before that get a full snapshot.
+    """
+
+    def __init__(self, retention_days=30):
+        self.retention_days = retention_days
+        self._pruned_at = 0.0
+
+    def bounds(self, cursor):
+        """(horizon, newest): tokens in [horizon, newest] can be caught up"""
+        cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'user_sync_log'")
+        row = cursor.fetchone()
+        newest = row[0] if row else 0
+        cursor.execute('SELECT MIN(seq) FROM user_sync_log')
+        oldest = cursor.fetchone()[0]
+        return (newest if oldest is None else oldest - 1), newest
+
+    def changes(self, cursor, user_id, since):
+        """(last seq, {entity: [ids]}) for the user's changes after `since`"""
+        cursor.execute('''
+        SELECT entity, entity_id, MAX(seq) FROM user_sync_log
+        WHERE user_id = ? AND seq > ?
+        GROUP BY entity, entity_id
+        ''', (user_id, since))
+        last = since
+        changed = {}
+        for entity, entity_id, seq in cursor.fetchall():
+            changed.setdefault(entity, []).append(entity_id)
+            last = max(last, seq)
+        return last, changed
+
+    def rows(self, cursor, user_id, entity, ids=None):
+        """(rows, deleted ids) of one entity: every row for the user, or only
+        `ids`, in which case ids with no row left are reported as deleted"""
+        table, key, columns = ENTITIES[entity]
+        select = ', '.join('t.' + column for column in columns)
+        if ids is None:
+            cursor.execute('SELECT %s FROM %s AS t WHERE t.user_id = ?' % (select, table),
+                           (user_id,))
+        else:
+            # CROSS JOIN fixes the loop order, so every id is a key lookup;
+            # with `key IN (SELECT ...)` SQLite walks all of the user's rows
+            # for tables keyed by rowid
+            cursor.execute('''
+            SELECT %s FROM json_each(?) AS ids CROSS JOIN %s AS t
+            ON t.%s = ids.value WHERE t.user_id = ?
+            ''' % (select, table, key), (json.dumps(ids), user_id))
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        deleted = []
+        if ids is not None and len(rows) < len(ids):
+            present = {row[key] for row in rows}
+            deleted = [entity_id for entity_id in ids if entity_id not in present]
+        return rows, deleted
+
+    def prune(self, conn, interval=60):
+        """Drop expired log entries and event ids, at most every `interval` seconds"""
+        now = time.monotonic()
+        if now - self._pruned_at < interval:
+            return False
+        self._pruned_at = now
+        cutoff = '-%d days' % self.retention_days
+        conn.execute('''
+        DELETE FROM user_sync_log WHERE seq <= (
+            SELECT seq FROM user_sync_log WHERE changed_at < datetime('now', ?)
+            ORDER BY changed_at DESC, seq DESC LIMIT 1)
+        ''', (cutoff,))
+        conn.execute('''
+        DELETE FROM user_sync_events WHERE applied_at < datetime('now', ?)
+        ''', (cutoff,))
+        conn.commit()
+        return True
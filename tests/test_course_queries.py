@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+from flask import g, request_finished
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='module')
+def server(tmp_path_factory):
+    root = tmp_path_factory.mktemp('courses')
+    database = str(root / 'test.db')
+    os.environ.update({
+        'KAZAKH_DATABASE': database,
+        'KAZAKH_CATALOG_CHECK_INTERVAL': '0',
+        'KAZAKH_METRICS': '1',
+        'KAZAKH_BUNDLE_DIR': str(root / 'bundles'),
+        'KAZAKH_SLOW_QUERY_LOG': str(root / 'slow_queries.ndjson'),
+    })
+    import database as db_module
+    conn = db_module.create_database(database)
+    db_module.populate_sample_data(conn)
+    conn.close()
+
+    import app as app_module
+    return app_module.app, database
+
+
+def add_courses(database, count):
+    conn = sqlite3.connect(database)
+    first = conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM courses').fetchone()[0]
+    conn.executemany('''
+    INSERT INTO courses (id, title_en, title_kk, title_ru, level, total_lessons, order_index)
+    VALUES (?, ?, ?, ?, 'beginner', 10, ?)
+    ''', [(i, 'Course %d' % i, 'Курс %d' % i, 'Курс %d' % i, i)
+          for i in range(first, first + count)])
+    conn.execute('UPDATE catalog_meta SET version = version + 1 WHERE id = 1')
+    conn.commit()
+    conn.close()
+
+
+def statements_for_courses(app, client):
+    counts = []
+
+    def record(sender, response, **extra):
+        counts.append(g.sql_stats.statements)
+
+    with request_finished.connected_to(record, app):
+        response = client.get('/api/courses')
+    assert response.status_code == 200
+    return len(response.get_json()), counts[0]
+
+
+def test_get_courses_query_count_is_constant(server):
+    app, database = server
+    client = app.test_client()
+    response = client.post('/api/register', json={
+        'username': 'counter', 'email': 'counter@example.com', 'password': 'password123'})
+    assert response.status_code in (200, 201)
+
+    small_courses, small_statements = statements_for_courses(app, client)
+    add_courses(database, 50)
+    large_courses, large_statements = statements_for_courses(app, client)
+
+    assert large_courses == small_courses + 50
+    assert small_statements >= 1
+    assert large_statements == small_statements
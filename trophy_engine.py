@@ -0,0 +1,85 @@
+from bisect import bisect_right
+
+
+# requirement_type -> users column holding the counter it is measured against
+REQUIREMENT_COUNTERS = {
+    'words_learned': 'total_words_learned',
+    'courses_completed': 'total_courses_completed',
+    'streak_days': 'streak_days',
+    'games_won': 'total_games_won',
+    'perfect_tests': 'total_perfect_tests',
+}
+
+
+class TrophyRules:
+    """Trophy rules indexed by requirement_type with thresholds in sorted order"""
+
+    __slots__ = ('version', 'thresholds', 'trophy_ids')
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        trophies = catalog.trophies
+        type_pos = trophies.col('requirement_type')
+        value_pos = trophies.col('requirement_value')
+        id_pos = trophies.col('id')
+
+        by_type = {}
+        for row in trophies.rows:
+            if row[type_pos] in REQUIREMENT_COUNTERS and row[value_pos] is not None:
+                by_type.setdefault(row[type_pos], []).append((row[value_pos], row[id_pos]))
+
+        self.thresholds = {}
+        self.trophy_ids = {}
+        for requirement_type, rules in by_type.items():
+            rules.sort()
+            self.thresholds[requirement_type] = tuple(value for value, _ in rules)
+            self.trophy_ids[requirement_type] = tuple(trophy_id for _, trophy_id in rules)
+
+    def crossed(self, requirement_type, old, new):
+        """Ids of trophies whose threshold lies in (old, new]"""
+        thresholds = self.thresholds.get(requirement_type)
+        if not thresholds or new <= old:
+            return ()
+        lo = bisect_right(thresholds, old)
+        hi = bisect_right(thresholds, new)
+        return self.trophy_ids[requirement_type][lo:hi]
+
+
+class TrophyEngine:
+    """Awards trophies when a user's counter crosses a rule threshold.
+
+    Callers pass the cursor of their own transaction, so the counter update,
+    the awards and the trigger-maintained users.total_trophies all commit
+    (or roll back) together with the event that caused them.
+    """
+
+    def __init__(self):
+        self.rules = None
+
+    def load(self, catalog):
+        """Rebuild the rule index; registered as a catalog reload callback"""
+        self.rules = TrophyRules(catalog)
+
+    def evaluate(self, cursor, user_id, requirement_type, old, new):
+        """Award trophies for a counter that moved from old to new"""
+        awarded = []
+        for trophy_id in self.rules.crossed(requirement_type, old, new):
+            cursor.execute('''
+            INSERT OR IGNORE INTO user_trophies (user_id, trophy_id) VALUES (?, ?)
+            ''', (user_id, trophy_id))
+            if cursor.rowcount:
+                awarded.append(trophy_id)
+        return awarded
+
+    def increment(self, cursor, user_id, requirement_type, delta=1):
+        """Add delta to the event's counter on users and award crossed trophies"""
+        column = REQUIREMENT_COUNTERS[requirement_type]
+        cursor.execute(
+            'UPDATE users SET {0} = {0} + ? WHERE id = ? RETURNING {0}'.format(column),
+            (delta, user_id)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return []
+        new = row[0]
+        return self.evaluate(cursor, user_id, requirement_type, new - delta, new)
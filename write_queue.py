@@ -0,0 +1,148 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue for non-critical writes.
+
+    Writes are submitted as (sql, params) under a coalescing key; a later
+    write with the same key replaces the pending one, so e.g. several
+    last_login updates for one user collapse into a single UPDATE. A
+    background thread group-commits pending writes every `interval_ms`
+    milliseconds or as soon as `batch_size` writes are pending. When the
+    queue is full, `submit()` runs the write synchronously instead.
+
+    The flusher is started lazily by the first submit in each process, so a
+    queue created before a gunicorn fork works in every worker.
+    """
+
+    def __init__(self, database, interval_ms=200, batch_size=100, max_pending=10000,
+                 busy_timeout=5000):
+        self.database = database
+        self.interval = interval_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.busy_timeout = busy_timeout
+        self._pending = OrderedDict()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._conn = None
+        self._pid = None
+        self._atexit_registered = False
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.coalesced = 0
+        self.sync_fallbacks = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid != os.getpid():
+                # Inherited across fork: the parent's thread and connection
+                # do not exist here, and its pending writes are its own
+                self._pending.clear()
+                self._conn = None
+                self._pid = os.getpid()
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self):
+        """Flush everything still pending and stop the flusher"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def submit(self, key, sql, params=()):
+        """Queue a write; runs it synchronously if the queue is full"""
+        if not self._stopping:
+            self._ensure_started()
+        with self._lock:
+            if key in self._pending:
+                self._pending[key] = (sql, params)
+                self.coalesced += 1
+                return True
+            if len(self._pending) < self.max_pending and not self._stopping:
+                self._pending[key] = (sql, params)
+                if len(self._pending) >= self.batch_size:
+                    self._wakeup.set()
+                return True
+            self.sync_fallbacks += 1
+        self._write([(sql, params)])
+        return False
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000.0,
+                                         check_same_thread=False)
+            self._conn.execute('PRAGMA busy_timeout = %d' % self.busy_timeout)
+        return self._conn
+
+    def _write(self, writes):
+        with self._write_lock:
+            started = time.perf_counter()
+            conn = self._connection()
+            try:
+                with conn:
+                    for sql, params in writes:
+                        conn.execute(sql, params)
+            except sqlite3.Error:
+                self.errors += 1
+                raise
+            finally:
+                elapsed = (time.perf_counter() - started) * 1000
+                self.last_flush_ms = elapsed
+                self.max_flush_ms = max(self.max_flush_ms, elapsed)
+
+    def flush(self):
+        """Group-commit every pending write in one transaction"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            writes = list(self._pending.values())
+            self._pending.clear()
+        try:
+            self._write(writes)
+        except sqlite3.Error:
+            return 0
+        self.flushes += 1
+        self.flushed_writes += len(writes)
+        return len(writes)
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def stats(self):
+        return {
+            'depth': len(self._pending),
+            'max_pending': self.max_pending,
+            'flushes': self.flushes,
+            'flushed_writes': self.flushed_writes,
+            'coalesced': self.coalesced,
+            'sync_fallbacks': self.sync_fallbacks,
+            'errors': self.errors,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }